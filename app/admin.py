@@ -0,0 +1,146 @@
+import os
+import html
+import secrets
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import PlainTextResponse, StreamingResponse, HTMLResponse, JSONResponse
+from starlette.routing import Route
+
+from app.export import iter_export, FORMATS
+from app.database import EXPORT_KEYS, get_hardest_items
+from app.lessons import get_lesson
+from app import memprofile
+
+# Служебные маршруты /admin/*, /debug/* и /metrics открыты только с этим токеном
+# в заголовке «Authorization: Bearer <токен>» (не в URL — он попадает в access log);
+# без токена они выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def is_admin(request):
+    if not ADMIN_TOKEN:
+        return False
+    header = request.headers.get("authorization", "")
+    if not header.startswith("Bearer "):
+        return False
+    return secrets.compare_digest(header[len("Bearer "):].encode(), ADMIN_TOKEN.encode())
+
+
+def admin_only(endpoint):
+    """Маршрут отвечает 404 всем, кроме владельца ADMIN_TOKEN"""
+    async def wrapper(request):
+        if not is_admin(request):
+            return PlainTextResponse("Not Found", status_code=404)
+        return await endpoint(request)
+    return wrapper
+
+
+async def export_table(request):
+    """GET /admin/export/{table}?format=csv|ndjson — потоковая выгрузка таблицы"""
+    table = request.path_params["table"]
+    fmt = request.query_params.get("format", "csv")
+    if table not in EXPORT_KEYS or fmt not in FORMATS:
+        return PlainTextResponse("Unknown table or format", status_code=400)
+
+    # Запросы к базе идут в пуле потоков, event loop не блокируется
+    return StreamingResponse(
+        iterate_in_threadpool(iter_export(table, fmt)),
+        media_type=CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'},
+    )
+
+
+async def difficulty(request):
+    """GET /admin/difficulty?view=items|lessons&min_attempts=5&limit=50 — самое трудное в уроках"""
+    whole_lessons = request.query_params.get("view") == "lessons"
+    try:
+        min_attempts = int(request.query_params.get("min_attempts", 5))
+        limit = int(request.query_params.get("limit", 50))
+    except ValueError:
+        return PlainTextResponse("min_attempts and limit must be integers", status_code=400)
+
+    rows = await run_in_threadpool(get_hardest_items, whole_lessons, min_attempts, limit)
+    lines = []
+    for row in rows:
+        lesson = get_lesson(row['lesson_id'])
+        topic = f"{lesson['level']}: {lesson['topic']}" if lesson else "—"
+        item = "" if whole_lessons else f"<td>{row['item']}</td>"
+        lines.append(
+            f"<tr><td>{row['lesson_id']}</td><td>{html.escape(topic)}</td>{item}"
+            f"<td>{row['attempts']}</td><td>{row['correct']}</td><td>{row['failure_rate']:.0%}</td></tr>"
+        )
+    title = "Уроки" if whole_lessons else "Пункты заданий"
+    item_header = "" if whole_lessons else "<th>Пункт</th>"
+    return HTMLResponse(
+        f"<html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+        f"<h1>{title}: доля ошибок</h1>"
+        f"<table border='1' cellpadding='4'><tr><th>Урок</th><th>Тема</th>{item_header}"
+        f"<th>Попыток</th><th>Верно</th><th>Ошибок</th></tr>{''.join(lines)}</table>"
+        "</body></html>"
+    )
+
+
+def memory_endpoint(user_data):
+    """GET /debug/memory?action=... — профилирование памяти на работающем сервере.
+
+    action: status (по умолчанию), start[&frames=N], stop, top[&limit=N],
+    snapshot&name=..., diff&first=...[&second=...], user_data[&limit=N].
+    user_data — функция, возвращающая context.user_data всех пользователей.
+    """
+    async def memory(request):
+        params = request.query_params
+        action = params.get("action", "status")
+        try:
+            limit = int(params.get("limit", 20))
+            frames = int(params.get("frames", 1))
+            if action == "status":
+                result = memprofile.status()
+            elif action == "start":
+                result = memprofile.start(frames)
+            elif action == "stop":
+                result = memprofile.stop()
+            elif action == "top":
+                # Снимок всей кучи — долгий, делаем его вне event loop
+                result = await run_in_threadpool(memprofile.top, limit)
+            elif action == "snapshot":
+                result = await run_in_threadpool(memprofile.take_snapshot, params.get("name", "base"))
+            elif action == "diff":
+                result = await run_in_threadpool(
+                    memprofile.diff, params.get("first", "base"), params.get("second"), limit
+                )
+            elif action == "user_data":
+                # user_data меняют обработчики, поэтому считаем прямо в event loop
+                result = memprofile.user_data_sizes(user_data(), limit)
+            else:
+                return PlainTextResponse("Unknown action", status_code=400)
+        except ValueError as e:
+            return PlainTextResponse(str(e), status_code=400)
+        return JSONResponse(result)
+    return memory
+
+
+def watchdog_endpoints(watchdog):
+    """GET /metrics — задержка event loop для Prometheus; GET /debug/loop — места блокировок со стеками"""
+    async def metrics(request):
+        return PlainTextResponse(watchdog.metrics(), media_type="text/plain; version=0.0.4")
+
+    async def loop_report(request):
+        return JSONResponse(watchdog.report())
+    return metrics, loop_report
+
+
+def admin_routes(user_data=dict, watchdog=None):
+    routes = [
+        Route("/admin/export/{table}", admin_only(export_table), methods=["GET"]),
+        Route("/admin/difficulty", admin_only(difficulty), methods=["GET"]),
+        Route("/debug/memory", admin_only(memory_endpoint(user_data)), methods=["GET"]),
+    ]
+    if watchdog is not None:
+        metrics, loop_report = watchdog_endpoints(watchdog)
+        routes += [
+            Route("/metrics", admin_only(metrics), methods=["GET"]),
+            Route("/debug/loop", admin_only(loop_report), methods=["GET"]),
+        ]
+    return routes
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+
+from app.database import get_streak_reminder_users, get_broadcast, save_broadcast
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram — около 30 сообщений в секунду на бота; оставляем запас
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+# Пользователей на страницу выборки
+BROADCAST_PAGE = int(os.getenv("BROADCAST_PAGE", 500))
+# С какого часа напоминать о серии, которая прервётся в полночь
+STREAK_REMINDER_HOUR = int(os.getenv("STREAK_REMINDER_HOUR", 18))
+
+
+class RateLimiter:
+    """Пропускает не больше rate вызовов в секунду (равномерно)"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self.next_at > now:
+                await asyncio.sleep(self.next_at - now)
+            self.next_at = max(now, self.next_at) + self.interval
+
+    def pause(self, seconds):
+        """Никому не отправлять seconds секунд (ответ Telegram 429)"""
+        self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+def streak_reminder_text(user):
+    return (
+        f"🔥 Твоя серия — {user['current_streak']} дн. подряд!\n"
+        "Сегодня ты ещё не занимался: пройди один урок до полуночи, чтобы её не потерять."
+    )
+
+
+async def run_broadcast(bot, name, fetch_page, make_text, rate=BROADCAST_RATE, page_size=BROADCAST_PAGE):
+    """Рассылка с продолжением после перезапуска.
+
+    fetch_page(after_user_id, limit) отдаёт страницу пользователей по
+    возрастанию user_id. Отправки идут пачками по rate штук (около секунды
+    на пачку); после каждой пачки в broadcasts сохраняется последний
+    user_id и счётчики, так что после падения рассылка продолжится с того
+    же места, а повторно сообщение получит не больше одной пачки.
+    Возвращает dict(sent, failed, blocked, status).
+    """
+    state = await asyncio.to_thread(get_broadcast, name)
+    if state and state['status'] == 'done':
+        return dict(state)
+    counts = {
+        'sent': state['sent'] if state else 0,
+        'failed': state['failed'] if state else 0,
+        'blocked': state['blocked'] if state else 0,
+    }
+    last_user_id = state['last_user_id'] if state else 0
+    if state:
+        logger.info(f"Resuming broadcast {name} after user {last_user_id}")
+
+    limiter = RateLimiter(rate)
+    batch_size = max(1, int(rate))
+
+    while True:
+        users = await asyncio.to_thread(fetch_page, last_user_id, page_size)
+        if not users:
+            break
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            results = await asyncio.gather(*(_send(bot, limiter, user, make_text(user)) for user in batch))
+            for result in results:
+                counts[result] += 1
+            last_user_id = batch[-1]['user_id']
+            await asyncio.to_thread(save_broadcast, name, last_user_id, counts['sent'], counts['failed'], counts['blocked'])
+
+    await asyncio.to_thread(save_broadcast, name, last_user_id, counts['sent'], counts['failed'], counts['blocked'], 'done')
+    logger.info(f"Broadcast {name} finished: {counts}")
+    return {**counts, 'status': 'done'}
+
+
+async def _send(bot, limiter, user, text, attempts=3):
+    """'sent', 'blocked' или 'failed'"""
+    for _ in range(attempts):
+        await limiter.wait()
+        try:
+            await bot.send_message(chat_id=user['user_id'], text=text)
+            return 'sent'
+        except RetryAfter as e:
+            # Превысили лимит — притормаживаем всю рассылку, а не только этот вызов
+            limiter.pause(e.retry_after)
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as e:
+            logger.warning(f"Broadcast to {user['user_id']} failed: {e}")
+            return 'failed'
+        except TelegramError as e:
+            logger.warning(f"Broadcast to {user['user_id']} failed: {e}")
+    return 'failed'
+
+
+async def send_streak_reminders(bot, today=None):
+    """Напоминание тем, чья серия прервётся сегодня в полночь (не чаще раза в день)"""
+    today = today or datetime.date.today()
+    day = today.toordinal()
+    return await run_broadcast(
+        bot,
+        f"streak-reminder:{today.isoformat()}",
+        lambda after_user_id, limit: get_streak_reminder_users(day, after_user_id, limit),
+        streak_reminder_text,
+    )
@@ -1,15 +1,97 @@
 import sqlite3
+import asyncio
 import datetime
+import functools
+import threading
 import os
 
+from app import tracing
+from app.leaderboard import Leaderboard
+
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bot_data.db')
 
+# Хранилище: sqlite (файл DB_PATH) или postgres (DATABASE_URL, см. app/pg_storage.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+_backend = None
+
+def get_backend():
+    """Внешнее хранилище (PostgresStorage) или None для SQLite"""
+    global _backend
+    if STORAGE_BACKEND == "postgres" and _backend is None:
+        from app.pg_storage import PostgresStorage
+        _backend = PostgresStorage(os.environ["DATABASE_URL"])
+    return _backend
+
+def storage_method(func):
+    """Функция работы с данными: при STORAGE_BACKEND=postgres вызов уходит
+    в одноимённый метод PostgresStorage, иначе выполняется здесь, на SQLite.
+    При включённой трассировке каждый вызов — отдельный спан db.<имя>"""
+    if STORAGE_BACKEND == "sqlite":
+        call = func
+    else:
+        def call(*args, **kwargs):
+            return get_backend().call(func.__name__, *args, **kwargs)
+    if call is func and not tracing.ENABLED:
+        return func
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracing.span(f"db.{func.__name__}", backend=STORAGE_BACKEND):
+            return call(*args, **kwargs)
+    return wrapper
+
+async def run_async(func, *args, **kwargs):
+    """Вызов функции хранилища из обработчика, не блокируя event loop:
+    на Postgres запрос ждётся прямо в пуле asyncpg, иначе функция идёт в пул потоков"""
+    if STORAGE_BACKEND != "sqlite":
+        backend = get_backend()
+        if hasattr(backend, func.__name__):
+            with tracing.span(f"db.{func.__name__}", backend=STORAGE_BACKEND):
+                return await backend.call_async(func.__name__, *args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+# Программа тем: (topic_index, название, уровень)
+TOPICS = [
+    (1, "to be", "beginner"),
+    (2, "present continuous", "beginner"),
+    (3, "present simple", "beginner"),
+    (4, "past simple", "beginner"),
+    (5, "future simple", "beginner"),
+    (6, "modal verbs (can, must, should)", "beginner"),
+    (7, "comparatives and superlatives", "beginner"),
+    (8, "prepositions of time and place", "beginner"),
+    (9, "countable and uncountable nouns", "beginner"),
+    (10, "there is/there are", "beginner"),
+    (11, "present perfect", "intermediate"),
+    (12, "past continuous", "intermediate"),
+    (13, "future forms (going to, will)", "intermediate"),
+    (14, "conditionals 0 and 1", "intermediate"),
+    (15, "passive voice", "intermediate"),
+    (16, "phrasal verbs basic", "intermediate"),
+    (17, "relative clauses", "intermediate"),
+    (18, "reported speech", "intermediate"),
+    (19, "gerund and infinitive", "intermediate"),
+    (20, "quantifiers", "intermediate"),
+    (21, "present perfect continuous", "advanced"),
+    (22, "past perfect", "advanced"),
+    (23, "future perfect", "advanced"),
+    (24, "conditionals 2 and 3", "advanced"),
+    (25, "mixed conditionals", "advanced"),
+    (26, "advanced phrasal verbs", "advanced"),
+    (27, "inversion", "advanced"),
+    (28, "subjunctive mood", "advanced"),
+    (29, "collocations and idioms", "advanced"),
+    (30, "advanced discussion topics", "advanced")
+]
+
 def get_db():
     """Подключение к базе данных"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+@storage_method
 def init_db():
     """Создание таблиц при первом запуске"""
     with get_db() as conn:
@@ -69,91 +151,220 @@ def init_db():
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         ''')
+        
+        # Номер последнего активного дня (date.toordinal()) для серий
+        if _add_column(conn, 'users', 'last_active_day', 'INTEGER'):
+            # julianday('0001-01-01') = 1721425.5, а toordinal() этой даты = 1
+            conn.execute('''
+                UPDATE users 
+                SET last_active_day = CAST(julianday(substr(last_activity, 1, 10)) - 1721424.5 AS INTEGER)
+                WHERE last_activity IS NOT NULL
+            ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_users_last_active_day ON users (last_active_day)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_users_total_xp ON users (total_xp)')
+        
+        # Кто проверял ответ: локально или учитель (LLM)
+        _add_column(conn, 'answers_history', 'grader', 'TEXT')
+        
+        # Ответы и прогресс по целым id вместо текста: lesson_id — урок lessons_db,
+        # topic_index — тема из TOPICS (по пунктам заданий считает item_stats)
+        _add_column(conn, 'answers_history', 'topic_index', 'INTEGER')
+        _add_column(conn, 'lessons_progress', 'topic_index', 'INTEGER')
+        migrated = _add_column(conn, 'answers_history', 'lesson_id', 'INTEGER')
+        migrated = _add_column(conn, 'lessons_progress', 'lesson_id', 'INTEGER') or migrated
+        if migrated:
+            _normalize_lesson_rows(conn)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_user ON answers_history (user_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_lesson_id ON answers_history (lesson_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_topic_index ON answers_history (topic_index)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_lessons_progress_user ON lessons_progress (user_id)')
+        
+        # Интервальные повторения (SM-2) для user_topics
+        _add_column(conn, 'user_topics', 'ease', 'REAL DEFAULT 2.5')
+        _add_column(conn, 'user_topics', 'interval_days', 'INTEGER DEFAULT 0')
+        _add_column(conn, 'user_topics', 'due_at', 'TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_user_topics_user_due ON user_topics (user_id, due_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_user_topics_due ON user_topics (due_at, user_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_user_topics_status ON user_topics (user_id, status, topic_index)')
+        
+        # Дневные итоги ответов, в которые сворачивается старая answers_history (app/retention.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS answers_daily (
+                user_id INTEGER,
+                day TEXT,
+                total INTEGER DEFAULT 0,
+                correct INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            )
+        ''')
+        
+        # Сложность уроков lessons_db: попытки и верные ответы по (урок, пункт задания),
+        # пункт 0 — задание целиком; обновляется при каждой проверке ответа
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS item_stats (
+                lesson_id INTEGER,
+                item INTEGER,
+                attempts INTEGER DEFAULT 0,
+                correct INTEGER DEFAULT 0,
+                PRIMARY KEY (lesson_id, item)
+            )
+        ''')
+        
+        # Рассылки: состояние для продолжения после перезапуска (app/broadcast.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                name TEXT PRIMARY KEY,
+                last_user_id INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                blocked INTEGER DEFAULT 0,
+                status TEXT DEFAULT 'running',  -- 'running', 'done'
+                updated_at TEXT
+            )
+        ''')
+        
+        # Кэш сгенерированных уроков: несколько вариантов на (уровень, тема)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS generated_lessons (
+                level TEXT,
+                topic TEXT,
+                variant INTEGER,
+                content TEXT,
+                created_at TEXT,
+                served_count INTEGER DEFAULT 0,
+                PRIMARY KEY (level, topic, variant)
+            )
+        ''')
         conn.commit()
 
+def _add_column(conn, table, column, definition):
+    """Добавляет колонку в существующую таблицу (миграция старых баз)"""
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    return False
+
+def _normalize_lesson_rows(conn):
+    """Миграция старых строк: «Урок N» -> lesson_id, название темы -> topic_index.
+    
+    Тексты lesson_topic/question в таких строках собирались по шаблону
+    («Задание», «Урок по теме …»), поэтому после переноса обнуляются.
+    """
+    for table in ('answers_history', 'lessons_progress'):
+        text_columns = "lesson_topic = NULL, question = NULL" if table == 'answers_history' else "lesson_topic = NULL"
+        conn.execute(f'''
+            UPDATE {table}
+            SET lesson_id = CAST(substr(lesson_topic, 6) AS INTEGER), {text_columns}
+            WHERE lesson_topic LIKE 'Урок %'
+        ''')
+        conn.executemany(
+            f'UPDATE {table} SET topic_index = ?, {text_columns} WHERE lesson_topic = ?',
+            [(idx, topic) for idx, topic, level in TOPICS]
+        )
+
 def get_or_create_user(user_id, first_name, username):
     """Получить пользователя или создать нового"""
+    user, created = _get_or_create_user(user_id, first_name, username)
+    if created and _leaderboard is not None:
+        with _leaderboard_lock:
+            _leaderboard.update(user_id, 0)
+    return user
+
+@storage_method
+def _get_or_create_user(user_id, first_name, username):
+    """(пользователь, создан ли он сейчас)"""
     with get_db() as conn:
         user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
         
         if not user:
-            now = datetime.datetime.now().isoformat()
+            now = datetime.datetime.now()
             conn.execute('''
-                INSERT INTO users (user_id, first_name, username, joined_date, last_activity)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, first_name, username, now, now))
+                INSERT INTO users (user_id, first_name, username, joined_date, last_activity, last_active_day)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, first_name, username, now.isoformat(), now.isoformat(), now.date().toordinal()))
             conn.commit()
             user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+            return user, True
         
-        return user
+        return user, False
 
+@storage_method
 def update_streak(user_id):
-    """Обновить серию дней"""
+    """Обновить серию дней: один условный UPDATE по номеру последнего активного дня"""
+    now = datetime.datetime.now()
+    today = now.date().toordinal()
     with get_db() as conn:
-        user = conn.execute('SELECT last_activity, current_streak, best_streak FROM users WHERE user_id = ?', (user_id,)).fetchone()
-        
-        if user and user['last_activity']:
-            try:
-                last = datetime.datetime.fromisoformat(user['last_activity'])
-                now = datetime.datetime.now()
-                today = now.date()
-                last_date = last.date()
-                
-                # Если последняя активность была вчера
-                if (today - last_date).days == 1:
-                    new_streak = (user['current_streak'] or 0) + 1
-                    best_streak = max(new_streak, user['best_streak'] or 0)
-                    conn.execute('''
-                        UPDATE users 
-                        SET current_streak = ?, best_streak = ?, last_activity = ?
-                        WHERE user_id = ?
-                    ''', (new_streak, best_streak, now.isoformat(), user_id))
-                
-                # Если сегодня уже был
-                elif (today - last_date).days == 0:
-                    pass  # ничего не меняем
-                
-                # Если пропустил день
-                else:
-                    conn.execute('''
-                        UPDATE users 
-                        SET current_streak = 1, last_activity = ?
-                        WHERE user_id = ?
-                    ''', (now.isoformat(), user_id))
-            except:
-                # Если ошибка с датой, просто обновляем активность
-                conn.execute('''
-                    UPDATE users 
-                    SET last_activity = ?
-                    WHERE user_id = ?
-                ''', (datetime.datetime.now().isoformat(), user_id))
-            
-            conn.commit()
+        # Вчера был активен — серия растёт, иначе начинается заново.
+        # Если сегодня уже обновляли, WHERE не совпадёт и запись не меняется.
+        conn.execute('''
+            UPDATE users 
+            SET current_streak = CASE WHEN last_active_day = ? THEN COALESCE(current_streak, 0) + 1 ELSE 1 END,
+                best_streak = MAX(
+                    COALESCE(best_streak, 0),
+                    CASE WHEN last_active_day = ? THEN COALESCE(current_streak, 0) + 1 ELSE 1 END
+                ),
+                last_active_day = ?, last_activity = ?
+            WHERE user_id = ? AND (last_active_day IS NULL OR last_active_day < ?)
+        ''', (today - 1, today - 1, today, now.isoformat(), user_id, today))
+        conn.commit()
+
+@storage_method
+def reset_broken_streaks(today=None):
+    """Сбрасывает серии всем, кто пропустил день (один UPDATE на всех)"""
+    today = (today or datetime.date.today()).toordinal()
+    with get_db() as conn:
+        cursor = conn.execute(
+            'UPDATE users SET current_streak = 0 WHERE current_streak > 0 AND last_active_day < ?',
+            (today - 1,)
+        )
+        conn.commit()
+        return cursor.rowcount
 
 def add_xp(user_id, xp_amount):
     """Добавить очки опыта"""
+    total_xp = _add_xp(user_id, xp_amount)
+    
+    # Инкрементально обновляем рейтинг, если он уже загружен
+    if total_xp is not None and _leaderboard is not None:
+        with _leaderboard_lock:
+            _leaderboard.update(user_id, total_xp)
+
+@storage_method
+def _add_xp(user_id, xp_amount):
+    """Новое значение total_xp или None, если пользователя нет"""
     with get_db() as conn:
         conn.execute('UPDATE users SET total_xp = total_xp + ? WHERE user_id = ?', (xp_amount, user_id))
         conn.commit()
+        user = conn.execute('SELECT total_xp FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return user['total_xp'] if user else None
 
-def save_answer(user_id, lesson_topic, question, user_answer, correct):
-    """Сохранить ответ в историю"""
+@storage_method
+def save_answer(user_id, user_answer, correct, lesson_id=None, topic_index=None, grader=None):
+    """Сохранить ответ в историю.
+    
+    lesson_id — урок lessons_db, topic_index — тема из TOPICS; grader — что
+    решило, верен ли ответ: 'exact' или 'local' (grade_answer), 'heuristic'
+    (разбор дал учитель, а итог — простая проверка) или 'llm_unavailable'.
+    """
     with get_db() as conn:
         conn.execute('''
-            INSERT INTO answers_history (user_id, lesson_topic, question, user_answer, correct, answered_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, lesson_topic, question, user_answer, 1 if correct else 0, datetime.datetime.now().isoformat()))
+            INSERT INTO answers_history (user_id, lesson_id, topic_index, user_answer, correct, answered_at, grader)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, lesson_id, topic_index, user_answer, 1 if correct else 0, datetime.datetime.now().isoformat(), grader))
         conn.commit()
 
-def complete_lesson(user_id, lesson_topic):
-    """Отметить урок как пройденный"""
+@storage_method
+def complete_lesson(user_id, lesson_id=None, topic_index=None):
+    """Отметить урок (или тему) как пройденный"""
     with get_db() as conn:
         conn.execute('''
-            INSERT INTO lessons_progress (user_id, lesson_topic, completed, completed_at)
-            VALUES (?, ?, 1, ?)
-        ''', (user_id, lesson_topic, datetime.datetime.now().isoformat()))
+            INSERT INTO lessons_progress (user_id, lesson_id, topic_index, completed, completed_at)
+            VALUES (?, ?, ?, 1, ?)
+        ''', (user_id, lesson_id, topic_index, datetime.datetime.now().isoformat()))
         conn.commit()
 
+@storage_method
 def get_user_stats(user_id):
     """Получить статистику пользователя"""
     with get_db() as conn:
@@ -171,56 +382,32 @@ def get_user_stats(user_id):
             WHERE user_id = ?
         ''', (user_id,)).fetchone()
         
+        # Свёрнутые старые ответы
+        archived = conn.execute('''
+            SELECT SUM(total) as total, SUM(correct) as correct
+            FROM answers_daily
+            WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        
         return {
             'user': user,
             'lessons_count': lessons['count'] if lessons else 0,
-            'total_answers': answers['total'] if answers and answers['total'] else 0,
-            'correct_answers': answers['correct'] if answers and answers['correct'] else 0
+            'total_answers': (answers['total'] or 0) + (archived['total'] or 0),
+            'correct_answers': (answers['correct'] or 0) + (archived['correct'] or 0)
         }
 
 # === НОВЫЕ ФУНКЦИИ ДЛЯ РАБОТЫ С ТЕМАМИ ===
 
+@storage_method
 def init_user_topics(user_id):
     """Инициализирует темы для нового пользователя"""
-    topics = [
-        (1, "to be", "beginner"),
-        (2, "present continuous", "beginner"),
-        (3, "present simple", "beginner"),
-        (4, "past simple", "beginner"),
-        (5, "future simple", "beginner"),
-        (6, "modal verbs (can, must, should)", "beginner"),
-        (7, "comparatives and superlatives", "beginner"),
-        (8, "prepositions of time and place", "beginner"),
-        (9, "countable and uncountable nouns", "beginner"),
-        (10, "there is/there are", "beginner"),
-        (11, "present perfect", "intermediate"),
-        (12, "past continuous", "intermediate"),
-        (13, "future forms (going to, will)", "intermediate"),
-        (14, "conditionals 0 and 1", "intermediate"),
-        (15, "passive voice", "intermediate"),
-        (16, "phrasal verbs basic", "intermediate"),
-        (17, "relative clauses", "intermediate"),
-        (18, "reported speech", "intermediate"),
-        (19, "gerund and infinitive", "intermediate"),
-        (20, "quantifiers", "intermediate"),
-        (21, "present perfect continuous", "advanced"),
-        (22, "past perfect", "advanced"),
-        (23, "future perfect", "advanced"),
-        (24, "conditionals 2 and 3", "advanced"),
-        (25, "mixed conditionals", "advanced"),
-        (26, "advanced phrasal verbs", "advanced"),
-        (27, "inversion", "advanced"),
-        (28, "subjunctive mood", "advanced"),
-        (29, "collocations and idioms", "advanced"),
-        (30, "advanced discussion topics", "advanced")
-    ]
     
     with get_db() as conn:
         # Проверяем, есть ли уже темы у пользователя
         existing = conn.execute('SELECT COUNT(*) as count FROM user_topics WHERE user_id = ?', (user_id,)).fetchone()
         
         if existing['count'] == 0:
-            for idx, topic, level in topics:
+            for idx, topic, level in TOPICS:
                 # Первая тема будет current, остальные pending
                 status = 'current' if idx == 1 else 'pending'
                 conn.execute('''
@@ -231,6 +418,7 @@ def init_user_topics(user_id):
             return True
     return False
 
+@storage_method
 def get_current_topic(user_id):
     """Получает текущую тему для изучения"""
     with get_db() as conn:
@@ -255,16 +443,22 @@ def get_current_topic(user_id):
         
         return topic
 
+@storage_method
 def complete_topic(user_id, topic_id):
-    """Отмечает тему как пройденную"""
+    """Отмечает тему как пройденную и ставит первое повторение на завтра"""
+    now = datetime.datetime.now()
+    first_review = now + datetime.timedelta(days=1)
     with get_db() as conn:
         conn.execute('''
             UPDATE user_topics 
-            SET status = 'completed', completed_at = ?
+            SET status = 'completed', completed_at = ?,
+                interval_days = CASE WHEN due_at IS NULL THEN 1 ELSE interval_days END,
+                due_at = COALESCE(due_at, ?)
             WHERE id = ? AND user_id = ?
-        ''', (datetime.datetime.now().isoformat(), topic_id, user_id))
+        ''', (now.isoformat(), first_review.isoformat(), topic_id, user_id))
         conn.commit()
 
+@storage_method
 def get_completed_topics(user_id):
     """Возвращает список пройденных тем"""
     with get_db() as conn:
@@ -275,6 +469,7 @@ def get_completed_topics(user_id):
         ''', (user_id,)).fetchall()
         return topics
 
+@storage_method
 def get_all_topics(user_id):
     """Возвращает все темы пользователя"""
     with get_db() as conn:
@@ -285,6 +480,7 @@ def get_all_topics(user_id):
         ''', (user_id,)).fetchall()
         return topics
 
+@storage_method
 def start_repeating_topic(user_id, topic_id):
     """Начинает повторение темы"""
     with get_db() as conn:
@@ -301,6 +497,28 @@ def start_repeating_topic(user_id, topic_id):
         ''', (datetime.datetime.now().isoformat(), topic_id, user_id))
         conn.commit()
 
+@storage_method
+def get_topic(user_id, topic_id):
+    """Тема пользователя по id (поиск по первичному ключу)"""
+    with get_db() as conn:
+        topic = conn.execute(
+            'SELECT * FROM user_topics WHERE id = ? AND user_id = ?',
+            (topic_id, user_id)
+        ).fetchone()
+        return topic
+
+@storage_method
+def get_repeat_menu_topics(user_id):
+    """Пройденные и повторяемые темы для меню повторения — одним запросом"""
+    with get_db() as conn:
+        topics = conn.execute('''
+            SELECT * FROM user_topics 
+            WHERE user_id = ? AND status IN ('completed', 'repeating')
+            ORDER BY status, topic_index
+        ''', (user_id,)).fetchall()
+        return topics
+
+@storage_method
 def get_next_pending_topic(user_id):
     """Получает следующую ожидающую тему"""
     with get_db() as conn:
@@ -311,6 +529,7 @@ def get_next_pending_topic(user_id):
         ''', (user_id,)).fetchone()
         return topic
 
+@storage_method
 def get_repeating_topics(user_id):
     """Возвращает темы на повторении"""
     with get_db() as conn:
@@ -321,6 +540,7 @@ def get_repeating_topics(user_id):
         ''', (user_id,)).fetchall()
         return topics
 
+@storage_method
 def calculate_progress_percentage(user_id):
     """Вычисляет процент прогресса"""
     with get_db() as conn:
@@ -332,6 +552,7 @@ def calculate_progress_percentage(user_id):
             return round(percentage, 2)
         return 0.0
 
+@storage_method
 def reset_to_next_topic(user_id, current_topic_id):
     """Сбрасывает текущую тему и переходит к следующей (на случай ошибок)"""
     with get_db() as conn:
@@ -354,4 +575,265 @@ def reset_to_next_topic(user_id, current_topic_id):
             conn.commit()
             return next_topic
         conn.commit()
-        return None
\ No newline at end of file
+        return None
+
+# === ИНТЕРВАЛЬНЫЕ ПОВТОРЕНИЯ (SM-2) ===
+
+MIN_EASE = 1.3
+
+def next_review(ease, interval_days, quality):
+    """SM-2: новый (ease, interval_days) по оценке ответа quality от 0 до 5"""
+    ease = ease or 2.5
+    if quality < 3:
+        interval_days = 1
+    elif not interval_days:
+        interval_days = 1
+    elif interval_days == 1:
+        interval_days = 6
+    else:
+        interval_days = round(interval_days * ease)
+    ease = ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    return max(MIN_EASE, round(ease, 2)), interval_days
+
+@storage_method
+def review_topic(user_id, topic_id, quality):
+    """Записывает результат повторения и назначает следующее"""
+    now = datetime.datetime.now()
+    with get_db() as conn:
+        topic = conn.execute(
+            'SELECT ease, interval_days FROM user_topics WHERE id = ? AND user_id = ?',
+            (topic_id, user_id)
+        ).fetchone()
+        if not topic:
+            return None
+        
+        ease, interval_days = next_review(topic['ease'], topic['interval_days'], quality)
+        due_at = now + datetime.timedelta(days=interval_days)
+        conn.execute('''
+            UPDATE user_topics 
+            SET ease = ?, interval_days = ?, due_at = ?, last_repeated = ?
+            WHERE id = ? AND user_id = ?
+        ''', (ease, interval_days, due_at.isoformat(), now.isoformat(), topic_id, user_id))
+        conn.commit()
+        return due_at
+
+@storage_method
+def get_due_topics(user_id, now=None, limit=10):
+    """Темы, которые пора повторить (range-запрос по индексу user_id, due_at)"""
+    now = now or datetime.datetime.now()
+    with get_db() as conn:
+        topics = conn.execute('''
+            SELECT * FROM user_topics 
+            WHERE user_id = ? AND due_at <= ?
+            ORDER BY due_at LIMIT ?
+        ''', (user_id, now.isoformat(), limit)).fetchall()
+        return topics
+
+@storage_method
+def get_users_with_due_reviews(day=None):
+    """Пользователи, у которых есть повторения на день day (для уведомлений)"""
+    day = day or datetime.date.today()
+    end_of_day = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time())
+    with get_db() as conn:
+        users = conn.execute('''
+            SELECT user_id, COUNT(*) as due_count FROM user_topics 
+            WHERE due_at < ?
+            GROUP BY user_id
+        ''', (end_of_day.isoformat(),)).fetchall()
+        return users
+
+# === РЕЙТИНГ ПО XP ===
+
+LEADERBOARD_SIZE = 10
+
+# Рейтинг в памяти — для SQLite (один процесс); на Postgres get_top_users
+# и get_user_rank считаются запросами к общей базе (app/pg_storage.py)
+_leaderboard = None
+# Обработчики зовут функции хранилища из пула потоков (run_async) — рейтинг меняется под замком
+_leaderboard_lock = threading.RLock()
+
+def get_leaderboard():
+    """Рейтинг в памяти; строится одним проходом по users при первом обращении"""
+    global _leaderboard
+    if _leaderboard is None:
+        with _leaderboard_lock:
+            if _leaderboard is None:
+                board = Leaderboard(top_size=LEADERBOARD_SIZE)
+                board.load((row['user_id'], row['total_xp']) for row in _get_users_xp())
+                _leaderboard = board
+    return _leaderboard
+
+@storage_method
+def _get_users_xp():
+    with get_db() as conn:
+        return conn.execute('SELECT user_id, total_xp FROM users').fetchall()
+
+@storage_method
+def _get_user_names(user_ids):
+    placeholders = ', '.join('?' for _ in user_ids)
+    with get_db() as conn:
+        return conn.execute(
+            f'SELECT user_id, first_name, username FROM users WHERE user_id IN ({placeholders})',
+            list(user_ids)
+        ).fetchall()
+
+@storage_method
+def _get_user_xp(user_id):
+    with get_db() as conn:
+        user = conn.execute('SELECT total_xp FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return user['total_xp'] if user else None
+
+@storage_method
+def get_top_users():
+    """Топ пользователей по XP из кэша (имена — выборкой по первичному ключу)"""
+    board = get_leaderboard()
+    with _leaderboard_lock:
+        top = board.top()
+    if not top:
+        return []
+    
+    rows = _get_user_names([user_id for user_id, _ in top])
+    names = {row['user_id']: row for row in rows}
+    return [
+        {
+            'user_id': user_id,
+            'first_name': names[user_id]['first_name'] if user_id in names else None,
+            'username': names[user_id]['username'] if user_id in names else None,
+            'total_xp': xp
+        }
+        for user_id, xp in top
+    ]
+
+@storage_method
+def get_user_rank(user_id):
+    """Место пользователя в рейтинге и общее число участников"""
+    board = get_leaderboard()
+    if user_id not in board:
+        total_xp = _get_user_xp(user_id)
+        if total_xp is None:
+            return None, len(board)
+        with _leaderboard_lock:
+            board.update(user_id, total_xp)
+    with _leaderboard_lock:
+        return board.rank(user_id), len(board)
+
+# === СЛОЖНОСТЬ УРОКОВ ===
+
+@storage_method
+def record_item_results(lesson_id, results):
+    """Учитывает проверенный ответ: results — {пункт: верно ли}, пункт 0 — задание целиком"""
+    if not results:
+        return
+    with get_db() as conn:
+        conn.executemany('''
+            INSERT INTO item_stats (lesson_id, item, attempts, correct)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (lesson_id, item) DO UPDATE SET
+                attempts = attempts + 1,
+                correct = correct + excluded.correct
+        ''', [(lesson_id, item, 1 if correct else 0) for item, correct in results.items()])
+        conn.commit()
+
+@storage_method
+def get_hardest_items(whole_lessons=False, min_attempts=5, limit=50):
+    """Пункты (или, при whole_lessons, уроки целиком) с наибольшей долей ошибок"""
+    with get_db() as conn:
+        return conn.execute(f'''
+            SELECT lesson_id, item, attempts, correct,
+                   1.0 * (attempts - correct) / attempts AS failure_rate
+            FROM item_stats
+            WHERE item {'=' if whole_lessons else '>'} 0 AND attempts >= ?
+            ORDER BY failure_rate DESC, attempts DESC
+            LIMIT ?
+        ''', (min_attempts, limit)).fetchall()
+
+# === РАССЫЛКИ ===
+
+@storage_method
+def get_streak_reminder_users(day, after_user_id=0, limit=500):
+    """Страница пользователей, чья серия прервётся, если сегодня (day — toordinal()) не позаниматься.
+    
+    Keyset-пагинация по user_id: следующая страница начинается после after_user_id.
+    """
+    with get_db() as conn:
+        return conn.execute('''
+            SELECT user_id, first_name, current_streak FROM users
+            WHERE user_id > ? AND last_active_day = ? AND current_streak > 0
+            ORDER BY user_id LIMIT ?
+        ''', (after_user_id, day - 1, limit)).fetchall()
+
+@storage_method
+def get_broadcast(name):
+    """Сохранённое состояние рассылки или None"""
+    with get_db() as conn:
+        return conn.execute('SELECT * FROM broadcasts WHERE name = ?', (name,)).fetchone()
+
+@storage_method
+def save_broadcast(name, last_user_id, sent, failed, blocked, status='running'):
+    """Контрольная точка рассылки"""
+    with get_db() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO broadcasts (name, last_user_id, sent, failed, blocked, status, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (name, last_user_id, sent, failed, blocked, status, datetime.datetime.now().isoformat()))
+        conn.commit()
+
+# === ВЫГРУЗКА ===
+
+# Таблицы, доступные для выгрузки, и их ключ для keyset-пагинации
+EXPORT_KEYS = {'users': 'user_id', 'lessons_progress': 'id', 'answers_history': 'id'}
+
+@storage_method
+def get_export_page(table, after=0, limit=1000):
+    """Строки таблицы с ключом больше after (по возрастанию ключа).
+    
+    Каждая страница — отдельный короткий SELECT: блокировка чтения снимается
+    сразу, и запись ответов не ждёт, пока идёт выгрузка.
+    """
+    key = EXPORT_KEYS[table]
+    with get_db() as conn:
+        return conn.execute(
+            f'SELECT * FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?',
+            (after, limit)
+        ).fetchall()
+
+# === КЭШ СГЕНЕРИРОВАННЫХ УРОКОВ ===
+
+@storage_method
+def take_cached_lesson(level, topic):
+    """Следующий по кругу вариант урока из кэша или None"""
+    with get_db() as conn:
+        lesson = conn.execute('''
+            SELECT variant, content FROM generated_lessons 
+            WHERE level = ? AND topic = ?
+            ORDER BY served_count, variant LIMIT 1
+        ''', (level, topic)).fetchone()
+        if not lesson:
+            return None
+        
+        conn.execute('''
+            UPDATE generated_lessons SET served_count = served_count + 1
+            WHERE level = ? AND topic = ? AND variant = ?
+        ''', (level, topic, lesson['variant']))
+        conn.commit()
+        return lesson['content']
+
+@storage_method
+def get_cached_variants(level, topic):
+    """Номера вариантов урока, которые уже есть в кэше"""
+    with get_db() as conn:
+        rows = conn.execute(
+            'SELECT variant FROM generated_lessons WHERE level = ? AND topic = ?',
+            (level, topic)
+        ).fetchall()
+        return [row['variant'] for row in rows]
+
+@storage_method
+def save_cached_lesson(level, topic, variant, content):
+    """Сохраняет сгенерированный вариант урока"""
+    with get_db() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO generated_lessons (level, topic, variant, content, created_at, served_count)
+            VALUES (?, ?, ?, ?, ?, 0)
+        ''', (level, topic, variant, content, datetime.datetime.now().isoformat()))
+        conn.commit()
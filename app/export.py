@@ -0,0 +1,48 @@
+import io
+import os
+import csv
+import json
+
+from app.database import get_export_page, EXPORT_KEYS
+
+# Строк за один запрос к базе
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", 1000))
+FORMATS = ("csv", "ndjson")
+
+
+def iter_rows(table, chunk=EXPORT_CHUNK):
+    """Все строки таблицы как dict — страницами, в памяти только одна страница"""
+    key = EXPORT_KEYS[table]
+    after = 0
+    while True:
+        rows = get_export_page(table, after, chunk)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+        after = rows[-1][key]
+
+
+def iter_export(table, fmt="csv", chunk=EXPORT_CHUNK):
+    """Выгрузка таблицы кусками текста: CSV с заголовком или JSON по строке (NDJSON)"""
+    if table not in EXPORT_KEYS:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = None
+    for number, row in enumerate(iter_rows(table, chunk), start=1):
+        if fmt == "ndjson":
+            buffer.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+        if number % chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,121 @@
+import re
+from difflib import SequenceMatcher
+
+# Пороги похожести ответа на эталон (0..1)
+MATCH_THRESHOLD = 0.9   # выше — точно верно
+MISS_THRESHOLD = 0.5    # ниже — точно неверно
+# Доля верных пунктов, при которой задание засчитывается
+PASS_RATIO = 0.7
+
+CONTRACTIONS = {
+    "don't": "do not", "doesn't": "does not", "didn't": "did not", "isn't": "is not",
+    "aren't": "are not", "wasn't": "was not", "weren't": "were not", "can't": "cannot",
+    "won't": "will not", "i'm": "i am", "it's": "it is", "he's": "he is", "she's": "she is",
+    "you're": "you are", "we're": "we are", "they're": "they are", "i've": "i have",
+    "haven't": "have not", "hasn't": "has not", "i'll": "i will", "let's": "let us",
+}
+
+ITEM_NUMBER_RE = re.compile(r"(?:^|\s)\d{1,2}[.)]\s*")
+# Конец предложения: «Sentence one. Sentence two.»
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+PUNCTUATION_RE = re.compile(r"[^\w\s']")
+# Вердикт учителя — первое слово ответа (возможно, в тегах и с пунктуацией вокруг)
+VERDICT_RE = re.compile(r"^(?:<[^>]*>|[^\w<])*(НЕВЕРНО|ВЕРНО)\b(?:<[^>]*>|[^\w<])*", re.IGNORECASE)
+LATIN_RE = re.compile(r"[a-zA-Z]")
+
+
+def normalize(text):
+    """Нижний регистр, без пунктуации, с раскрытыми сокращениями"""
+    text = text.lower().replace("ё", "е").replace("’", "'")
+    text = PUNCTUATION_RE.sub(" ", text)
+    words = [CONTRACTIONS.get(word, word) for word in text.split()]
+    return " ".join(words)
+
+
+def split_items(answer, count):
+    """Ответ ученика на пункты: «1. ... 2. ...», по строкам, через «;», по предложениям,
+    через «,» или пробел"""
+    if count <= 1:
+        return [answer]
+    numbered = [item for item in ITEM_NUMBER_RE.split(answer) if item.strip()]
+    if len(numbered) == count:
+        return numbered
+    for items in (answer.split("\n"), answer.split(";"), SENTENCE_END_RE.split(answer),
+                  answer.split(","), answer.split()):
+        items = [item for item in items if item.strip()]
+        if len(items) == count:
+            return items
+    return numbered
+
+
+def similarity(answer, expected):
+    """Лучшая похожесть ответа на эталон (варианты эталона — через «/»)"""
+    answer = normalize(answer)
+    best = 0.0
+    for variant in expected.split("/"):
+        variant = normalize(variant)
+        if answer == variant:
+            return 1.0
+        best = max(best, SequenceMatcher(None, answer, variant).ratio())
+    return best
+
+
+def grade_answer(answer, expected_answers=None):
+    """Локальная проверка ответа.
+
+    Возвращает dict(correct, tier, score, items): tier — кто решил ('exact'
+    или 'local'); correct=None и tier='llm' значит, что локально уверенно
+    решить нельзя и ответ нужно отдать учителю (LLM). items — итог по пунктам
+    задания (True/False, None — неясно) или None, если на пункты не разбить.
+    """
+    if not answer or not answer.strip():
+        return {'correct': False, 'tier': 'local', 'score': 0.0, 'items': None}
+
+    # Ждём ответ на английском (сгенерированные уроки — перевод на английский),
+    # а в ответе нет ни одной латинской буквы — точно мимо
+    expects_english = not expected_answers or any(LATIN_RE.search(expected) for expected in expected_answers)
+    if expects_english and not LATIN_RE.search(answer):
+        return {'correct': False, 'tier': 'local', 'score': 0.0, 'items': None}
+
+    if not expected_answers:
+        return {'correct': None, 'tier': 'llm', 'score': None, 'items': None}
+
+    items = split_items(answer, len(expected_answers))
+    if len(items) != len(expected_answers):
+        return {'correct': None, 'tier': 'llm', 'score': None, 'items': None}
+
+    scores = [similarity(item, expected) for item, expected in zip(items, expected_answers)]
+    score = sum(score >= MATCH_THRESHOLD for score in scores) / len(scores)
+    results = [
+        True if item_score >= MATCH_THRESHOLD else False if item_score < MISS_THRESHOLD else None
+        for item_score in scores
+    ]
+    if all(score == 1.0 for score in scores):
+        return {'correct': True, 'tier': 'exact', 'score': 1.0, 'items': results}
+    if None in results:
+        return {'correct': None, 'tier': 'llm', 'score': score, 'items': results}
+    return {'correct': score >= PASS_RATIO, 'tier': 'local', 'score': score, 'items': results}
+
+
+def resolve_grade(grade):
+    """Итог локальной проверки без учителя: (верно ли задание, {пункт: верно ли}), пункт 0 — всё задание.
+
+    Почти совпавший пункт (опечатка) засчитывается, как и в тесте на уровень;
+    ответ, который не разбить на пункты, — нет.
+    """
+    items = {item: result is not False for item, result in enumerate(grade['items'] or [], start=1)}
+    if grade['correct'] is not None:
+        correct = grade['correct']
+    elif items:
+        correct = sum(items.values()) / len(items) >= PASS_RATIO
+    else:
+        correct = False
+    return correct, {0: correct, **items}
+
+
+def parse_verdict(text):
+    """(верно ли, разбор) из ответа учителя «ВЕРНО/НЕВЕРНО ...»; None — вердикта нет"""
+    match = VERDICT_RE.match(text or "")
+    if match is None:
+        return None, text
+    return match.group(1).upper() == "ВЕРНО", text[match.end():].strip()
@@ -1,17 +1,52 @@
+import os
+import html
+import asyncio
+import datetime
+import functools
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import CommandStart, Command
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.utils.exceptions import MessageNotModified
 import app.keyboards as kb
-from app.ai_teacher import generate_lesson, check_answer
+from app.lesson_cache import get_cached_lesson, generate_and_cache, stream_and_cache
+from app.prefetch import prefetch_lesson, take_prefetched
+from app.streaming import stream_lesson, answer_long, judge_answer
+from app.llm_guard import teacher, LLMUnavailable, StreamInterrupted, fallback_lesson
+from app.lessons import format_lesson
+from app.grading import grade_answer, resolve_grade, parse_verdict
 from app.database import (
     get_or_create_user, update_streak, add_xp, save_answer, 
     complete_lesson, get_user_stats, init_user_topics,
     get_current_topic, get_completed_topics, get_all_topics,
     start_repeating_topic, get_next_pending_topic, 
-    get_repeating_topics, calculate_progress_percentage, complete_topic
+    calculate_progress_percentage, complete_topic,
+    review_topic, get_topic, get_repeat_menu_topics, run_async
 )
 
+# При промахе кэша показывать урок по мере генерации (правками одного сообщения)
+LESSON_STREAMING = os.getenv("LESSON_STREAMING", "0") == "1"
+# Меню на inline-кнопках: переходы редактируют сообщение, а не шлют новое
+INLINE_NAVIGATION = os.getenv("INLINE_NAVIGATION", "0") == "1"
+
+HELP_TEXT = (
+    "🔍 <b>Помощь</b>\n\n"
+    "/start - Главное меню\n"
+    "📚 Новый урок - следующий урок по программе\n"
+    "📊 Мой прогресс - статистика\n"
+    "🔄 Повторить тему - выбрать тему для повторения\n"
+    "❓ Помощь - эта справка\n\n"
+    "Всего 30 тем. После каждой темы ты получаешь XP и продвигаешься дальше!"
+)
+
+def main_markup():
+    """Клавиатура главного меню для текущего режима навигации"""
+    return kb.main_menu_inline if INLINE_NAVIGATION else kb.main_menu
+
+def lesson_markup():
+    """Клавиатура после ответа на задание"""
+    return kb.lesson_inline if INLINE_NAVIGATION else kb.lesson_keyboard
+
 # Состояния для хранения контекста урока
 class LessonStates(StatesGroup):
     waiting_for_answer = State()
@@ -24,28 +59,29 @@ class LessonStates(StatesGroup):
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
     # Сохраняем пользователя в базу
-    user = get_or_create_user(
+    user = await run_async(
+        get_or_create_user,
         message.from_user.id,
         message.from_user.first_name,
         message.from_user.username
     )
     
     # Инициализируем темы для нового пользователя
-    init_user_topics(message.from_user.id)
+    await run_async(init_user_topics, message.from_user.id)
     
     # Обновляем серию
-    update_streak(message.from_user.id)
+    await run_async(update_streak, message.from_user.id)
     
     # Получаем обновлённые данные
-    stats = get_user_stats(message.from_user.id)
+    stats = await run_async(get_user_stats, message.from_user.id)
     user = stats['user']
     
     # Получаем текущую тему
-    current_topic = get_current_topic(message.from_user.id)
+    current_topic = await run_async(get_current_topic, message.from_user.id)
     current_topic_name = current_topic['topic_name'] if current_topic else "Не выбрана"
     
     # Прогресс
-    progress = calculate_progress_percentage(message.from_user.id)
+    progress = await run_async(calculate_progress_percentage, message.from_user.id)
     
     welcome_text = (
         "👋 <b>Welcome to NeuroEnglish!</b>\n\n"
@@ -58,34 +94,71 @@ async def cmd_start(message: types.Message):
         "Выбери действие:"
     )
     
-    await message.answer(welcome_text, reply_markup=kb.main_menu, parse_mode="HTML")
+    await message.answer(welcome_text, reply_markup=main_markup(), parse_mode="HTML")
 
 async def cmd_help(message: types.Message):
     """Обработчик команды /help"""
-    help_text = (
-        "🔍 <b>Помощь</b>\n\n"
-        "/start - Главное меню\n"
-        "📚 Новый урок - следующий урок по программе\n"
-        "📊 Мой прогресс - статистика\n"
-        "🔄 Повторить тему - выбрать тему для повторения\n"
-        "❓ Помощь - эта справка\n\n"
-        "Всего 30 тем. После каждой темы ты получаешь XP и продвигаешься дальше!"
-    )
-    await message.answer(help_text, parse_mode="HTML", reply_markup=kb.main_menu)
+    await message.answer(HELP_TEXT, parse_mode="HTML", reply_markup=main_markup())
 
 # ==================== ОБРАБОТЧИКИ КНОПОК ====================
 
+async def send_lesson(message: types.Message, user_id, topic, wait_text):
+    """Отправляет урок по теме: подготовленный заранее, из кэша или сгенерированный.
+    
+    Возвращает эталонные ответы, если урок взят из базы (иначе None).
+    """
+    level, name = topic['topic_level'], topic['topic_name']
+    
+    # Урок, подготовленный после прошлого ответа, иначе — из кэша
+    expected_answers = None
+    lesson = take_prefetched(user_id, topic['id'])
+    if lesson is None:
+        lesson = await get_cached_lesson(level, name)
+    
+    try:
+        if lesson is None and LESSON_STREAMING:
+            # Промах кэша: показываем урок по мере генерации; одновременные промахи ждут тот же поток
+            lesson, streamed = await stream_and_cache(
+                level, name, functools.partial(stream_lesson, message, level, name)
+            )
+            if streamed:
+                return None
+        
+        if lesson is None:
+            # Промах кэша: генерируем через DeepSeek
+            await message.answer(wait_text, parse_mode="HTML")
+            lesson = await generate_and_cache(level, name)
+    except StreamInterrupted:
+        # Начало урока уже показано, об обрыве сказано там же — запасной урок следом только запутает
+        return None
+    except LLMUnavailable:
+        # Учитель недоступен — отдаём готовый урок из базы того же уровня
+        # Поиск по урокам может строить индекс — не в event loop
+        static = await asyncio.to_thread(fallback_lesson, level, name)
+        expected_answers = static['answers'] if static else None
+        if static is None:
+            lesson = "😔 Учитель сейчас перегружен. Попробуй через пару минут."
+        else:
+            lesson = "⚠️ Учитель сейчас перегружен, вот урок из нашей базы:\n\n" + format_lesson(static)
+    
+    # Сгенерированный урок бывает длиннее лимита Telegram
+    await answer_long(message, lesson)
+    return expected_answers
+
 async def new_lesson(message: types.Message, state: FSMContext = None):
     """Начать новый урок"""
     if state:
         await state.finish()
-    
+    await start_lesson(message, message.from_user.id)
+
+async def start_lesson(message: types.Message, user_id):
+    """Урок по текущей теме пользователя user_id (новым сообщением в чат message)"""
     # Получаем текущую тему для пользователя
-    current_topic = get_current_topic(message.from_user.id)
+    current_topic = await run_async(get_current_topic, user_id)
     
     if not current_topic:
         # Если нет текущей темы, берём следующую
-        next_topic = get_next_pending_topic(message.from_user.id)
+        next_topic = await run_async(get_next_pending_topic, user_id)
         if next_topic:
             current_topic = next_topic
         else:
@@ -94,43 +167,39 @@ async def new_lesson(message: types.Message, state: FSMContext = None):
                 "🎉 <b>Поздравляю!</b> Ты прошёл все 30 тем!\n\n"
                 "Теперь ты можешь повторять любые темы или просто практиковаться в разговоре.\n"
                 "Нажми '🔄 Повторить тему', чтобы выбрать что-то для повторения.",
-                reply_markup=kb.main_menu,
+                reply_markup=main_markup(),
                 parse_mode="HTML"
             )
             return
     
-    await message.answer(
-        f"⏳ Генерирую урок на тему <b>{current_topic['topic_name']}</b>... Подожди секунду...", 
-        parse_mode="HTML"
+    expected_answers = await send_lesson(
+        message, user_id, current_topic,
+        f"⏳ Генерирую урок на тему <b>{current_topic['topic_name']}</b>... Подожди секунду..."
     )
     
-    # Генерируем урок через DeepSeek
-    lesson = await generate_lesson(level=current_topic['topic_level'], topic=current_topic['topic_name'])
-    
-    # Отправляем урок
-    await message.answer(lesson, parse_mode="HTML")
-    
     # Сохраняем тему урока в состояние
     await LessonStates.waiting_for_answer.set()
-    state = dp.current_state(chat=message.chat.id, user=message.from_user.id)
+    state = dp.current_state(chat=message.chat.id, user=user_id)
     await state.update_data(
         current_topic_id=current_topic['id'],
         current_topic_name=current_topic['topic_name'],
-        current_topic_level=current_topic['topic_level']
+        current_topic_index=current_topic['topic_index'],
+        current_topic_level=current_topic['topic_level'],
+        expected_answers=expected_answers
     )
 
-async def show_progress(message: types.Message):
-    """Показать прогресс пользователя"""
-    stats = get_user_stats(message.from_user.id)
+async def build_progress_text(user_id):
+    """Текст экрана прогресса"""
+    stats = await run_async(get_user_stats, user_id)
     user = stats['user']
     
     # Получаем все темы
-    all_topics = get_all_topics(message.from_user.id)
-    completed_topics = get_completed_topics(message.from_user.id)
-    current_topic = get_current_topic(message.from_user.id)
+    all_topics = await run_async(get_all_topics, user_id)
+    completed_topics = await run_async(get_completed_topics, user_id)
+    current_topic = await run_async(get_current_topic, user_id)
     
     # Прогресс
-    progress = calculate_progress_percentage(message.from_user.id)
+    progress = await run_async(calculate_progress_percentage, user_id)
     
     # Определяем уровень по XP
     if user['total_xp'] < 500:
@@ -168,52 +237,48 @@ async def show_progress(message: types.Message):
         progress_text += f"📖 Текущая тема: <b>{current_topic['topic_name']}</b>\n"
     
     progress_text += "\nНажми '📚 Новый урок', чтобы продолжить!"
-    
-    await message.answer(progress_text, parse_mode="HTML", reply_markup=kb.main_menu)
+    return progress_text
 
-async def repeat_topic_menu(message: types.Message):
-    """Меню выбора темы для повторения"""
-    # Получаем все пройденные темы
-    completed = get_completed_topics(message.from_user.id)
-    repeating = get_repeating_topics(message.from_user.id)
+async def show_progress(message: types.Message):
+    """Показать прогресс пользователя"""
+    await message.answer(await build_progress_text(message.from_user.id), parse_mode="HTML", reply_markup=main_markup())
+
+async def build_repeat_menu(user_id):
+    """Текст и клавиатура меню повторения; (None, None), если повторять нечего"""
+    # Пройденные и повторяемые темы — одним запросом
+    topics = await run_async(get_repeat_menu_topics, user_id)
+    completed = [topic for topic in topics if topic['status'] == 'completed']
+    repeating = [topic for topic in topics if topic['status'] == 'repeating']
     
     if not completed and not repeating:
-        await message.answer(
-            "📭 У тебя пока нет пройденных тем. Сначала пройди несколько уроков!",
-            reply_markup=kb.main_menu
-        )
-        return
-    
-    # Создаём клавиатуру с темами для повторения
-    from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-    
-    topics_keyboard = []
-    
-    # Добавляем пройденные темы
-    for topic in completed[:10]:
-        short_name = topic['topic_name'][:30]
-        topics_keyboard.append([KeyboardButton(text=f"🔄 {short_name}")])
+        return None, None
     
-    # Добавляем темы на повторении
-    for topic in repeating:
-        short_name = topic['topic_name'][:30]
-        topics_keyboard.append([KeyboardButton(text=f"🔁 {short_name} (повтор)")])
+    now = datetime.datetime.now().isoformat()
+    due = [topic for topic in topics if topic['due_at'] and topic['due_at'] <= now]
     
-    topics_keyboard.append([KeyboardButton(text="⬅️ В меню")])
+    due_text = ""
+    if due:
+        due_text = "⏰ <b>Пора повторить:</b> " + ", ".join(topic['topic_name'] for topic in due) + "\n\n"
     
-    repeat_keyboard = ReplyKeyboardMarkup(
-        keyboard=topics_keyboard,
-        resize_keyboard=True
-    )
-    
-    await message.answer(
+    text = (
         "📚 <b>Выбери тему для повторения:</b>\n\n"
+        f"{due_text}"
         "🔄 — пройденные темы\n"
         "🔁 — темы, которые уже на повторении\n\n"
-        "Просто нажми на нужную тему:",
-        reply_markup=repeat_keyboard,
-        parse_mode="HTML"
+        "Просто нажми на нужную тему:"
     )
+    return text, kb.repeat_topics_keyboard(completed[:10], repeating)
+
+NO_TOPICS_TEXT = "📭 У тебя пока нет пройденных тем. Сначала пройди несколько уроков!"
+
+async def repeat_topic_menu(message: types.Message):
+    """Меню выбора темы для повторения"""
+    text, markup = await build_repeat_menu(message.from_user.id)
+    if text is None:
+        await message.answer(NO_TOPICS_TEXT, reply_markup=main_markup())
+        return
+    
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
 
 async def help_button(message: types.Message):
     """Кнопка помощи"""
@@ -226,7 +291,7 @@ async def cancel_lesson(message: types.Message, state: FSMContext):
     await state.finish()
     await message.answer(
         "👋 Возвращаюсь в главное меню. Хочешь продолжить позже — нажимай 'Новый урок'!",
-        reply_markup=kb.main_menu,
+        reply_markup=main_markup(),
         parse_mode="HTML"
     )
 
@@ -242,96 +307,156 @@ async def handle_answer(message: types.Message, state: FSMContext):
     topic_id = data.get('current_topic_id')
     topic_name = data.get('current_topic_name', 'unknown')
     
-    await message.answer("⏳ Проверяю ответ...")
-    
-    # Проверяем ответ через DeepSeek
-    feedback = await check_answer(
-        question=f"Задание по теме '{topic_name}'",
-        user_answer=user_answer
-    )
-    
-    # Простая проверка для начисления XP
-    correct = len(user_answer.split()) >= 2
+    # Сначала локальная проверка по известным ответам; учителя (LLM) зовём,
+    # только если эталонных ответов нет (сгенерированный урок)
+    expected_answers = data.get('expected_answers')
+    grade = grade_answer(user_answer, expected_answers)
+    correct = grade['correct']
+    # Что на самом деле решило, верен ли ответ (для статистики по уровням проверки)
+    grader = grade['tier']
+    
+    if grade['tier'] == 'llm' and expected_answers:
+        # Эталон есть, но уверенности нет: итог — по пунктам, почти совпавшие засчитываются
+        correct, _ = resolve_grade(grade)
+        grader = 'local'
+    
+    if grade['tier'] == 'llm' and not expected_answers:
+        await message.answer("⏳ Проверяю ответ...")
+        try:
+            correct, feedback = parse_verdict(await teacher.call(judge_answer, topic_name, user_answer))
+            grader = 'llm'
+        except LLMUnavailable:
+            correct = None
+        if correct is None:
+            # Без вердикта ответ не засчитывается и не влияет на повторения
+            feedback = "📝 Ответ сохранён, но проверить его сейчас не получилось — учитель перегружен. Попробуй ещё раз позже."
+            grader = 'llm_unavailable'
+        elif not correct:
+            feedback = "❌ <b>Не совсем.</b>\n\n" + feedback
+        else:
+            feedback = "✅ <b>Верно!</b>\n\n" + feedback
+    elif correct:
+        feedback = "✅ <b>Верно!</b>"
+    else:
+        feedback = "❌ <b>Не совсем.</b>"
+        if expected_answers:
+            feedback += "\n\nПравильные ответы:\n" + "\n".join(
+                f"{number}. {html.escape(answer)}" for number, answer in enumerate(expected_answers, start=1)
+            )
+        else:
+            feedback += " Ответ нужно написать на английском."
     
     # Сохраняем в базу
-    save_answer(
+    await run_async(
+        save_answer,
         message.from_user.id,
-        topic_name,
-        f"Урок по теме {topic_name}",
         user_answer,
-        correct
+        bool(correct),
+        topic_index=data.get('current_topic_index'),
+        grader=grader
     )
     
+    # Повторение: SM-2 назначает следующую дату
+    if data.get('is_repeat') and grader != 'llm_unavailable':
+        await run_async(review_topic, message.from_user.id, topic_id, 4 if correct else 2)
+    
     if correct:
-        add_xp(message.from_user.id, 10)
+        await run_async(add_xp, message.from_user.id, 10)
         
         # Отмечаем тему как пройденную
-        complete_topic(message.from_user.id, topic_id)
+        await run_async(complete_topic, message.from_user.id, topic_id)
         
         # Получаем следующую тему
-        next_topic = get_next_pending_topic(message.from_user.id)
-        progress = calculate_progress_percentage(message.from_user.id)
+        next_topic = await run_async(get_next_pending_topic, message.from_user.id)
+        progress = await run_async(calculate_progress_percentage, message.from_user.id)
         
         feedback += f"\n\n✅ <b>+10 XP!</b>"
         feedback += f"\n📊 <b>Прогресс: {progress}%</b>"
         
         if next_topic:
             feedback += f"\n📚 Следующая тема: <b>{next_topic['topic_name']}</b>"
+            # Следующий «Новый урок» почти наверняка будет по этой теме
+            prefetch_lesson(message.from_user.id, next_topic)
         else:
             feedback += "\n🎉 Ты прошёл все темы! Можешь повторить что угодно."
     
     # Обновляем серию
-    update_streak(message.from_user.id)
+    await run_async(update_streak, message.from_user.id)
     
-    await message.answer(feedback, parse_mode="HTML", reply_markup=kb.lesson_keyboard)
+    await message.answer(feedback, parse_mode="HTML", reply_markup=lesson_markup())
     await state.finish()
 
-async def start_repeat_lesson(message: types.Message, state: FSMContext):
-    """Начать урок повторения по выбранной теме"""
-    # Очищаем текст от эмодзи и пометок
-    topic_text = message.text.replace("🔄 ", "").replace("🔁 ", "").replace(" (повтор)", "")
-    
-    # Ищем тему в базе
-    topics = get_all_topics(message.from_user.id)
-    selected_topic = None
-    
-    for topic in topics:
-        if topic['topic_name'] in topic_text or topic_text in topic['topic_name']:
-            selected_topic = topic
-            break
+async def start_repeat_lesson(callback: types.CallbackQuery, state: FSMContext):
+    """Начать урок повторения по выбранной теме (id темы — в callback_data)"""
+    await callback.answer()
+    message = callback.message
+    user_id = callback.from_user.id
+    
+    try:
+        topic_id = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        topic_id = None
+    selected_topic = await run_async(get_topic, user_id, topic_id) if topic_id else None
     
     if selected_topic:
         # Начинаем повторение
-        start_repeating_topic(message.from_user.id, selected_topic['id'])
+        await run_async(start_repeating_topic, user_id, selected_topic['id'])
         
-        await message.answer(
-            f"⏳ Генерирую урок для повторения темы <b>{selected_topic['topic_name']}</b>...", 
-            parse_mode="HTML"
+        expected_answers = await send_lesson(
+            message, user_id, selected_topic,
+            f"⏳ Генерирую урок для повторения темы <b>{selected_topic['topic_name']}</b>..."
         )
         
-        # Генерируем урок
-        lesson = await generate_lesson(level=selected_topic['topic_level'], topic=selected_topic['topic_name'])
-        
-        await message.answer(lesson, parse_mode="HTML")
-        
         await LessonStates.waiting_for_answer.set()
-        state = dp.current_state(chat=message.chat.id, user=message.from_user.id)
+        state = dp.current_state(chat=message.chat.id, user=user_id)
         await state.update_data(
             current_topic_id=selected_topic['id'],
             current_topic_name=selected_topic['topic_name'],
-            current_topic_level=selected_topic['topic_level']
+            current_topic_index=selected_topic['topic_index'],
+            current_topic_level=selected_topic['topic_level'],
+            expected_answers=expected_answers,
+            is_repeat=True
         )
     else:
         await message.answer(
             "❌ Тема не найдена. Попробуй ещё раз выбрать из списка.",
-            reply_markup=kb.main_menu
+            reply_markup=main_markup()
         )
 
+async def navigate(callback: types.CallbackQuery, state: FSMContext):
+    """Inline-навигация: экраны меню редактируют то же сообщение, уроки идут новыми"""
+    await callback.answer()
+    message = callback.message
+    user_id = callback.from_user.id
+    action = callback.data.split(":", 1)[1]
+    
+    if action == "lesson":
+        await state.finish()
+        await start_lesson(message, user_id)
+        return
+    
+    if action == "progress":
+        text, markup = await build_progress_text(user_id), kb.back_inline
+    elif action == "help":
+        text, markup = HELP_TEXT, kb.back_inline
+    elif action == "repeat":
+        text, markup = await build_repeat_menu(user_id)
+        if text is None:
+            text, markup = NO_TOPICS_TEXT, kb.back_inline
+    else:
+        await state.finish()
+        text, markup = "👋 Главное меню. Выбери действие:", kb.main_menu_inline
+    
+    try:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    except MessageNotModified:
+        pass
+
 async def handle_unknown(message: types.Message):
     """Обработка любых других сообщений"""
     await message.answer(
         "Я не понял команду. Используй кнопки или напиши /start",
-        reply_markup=kb.main_menu
+        reply_markup=main_markup()
     )
 
 # ==================== РЕГИСТРАЦИЯ ОБРАБОТЧИКОВ ====================
@@ -353,8 +478,11 @@ def register_handlers(dp: Dispatcher):
     dp.register_message_handler(new_lesson_during_lesson, state=LessonStates.waiting_for_answer, text="📚 Новый урок")
     dp.register_message_handler(handle_answer, state=LessonStates.waiting_for_answer)
     
-    # Обработчик выбора темы для повторения
-    dp.register_message_handler(start_repeat_lesson, lambda message: message.text.startswith("🔄") or message.text.startswith("🔁"))
+    # Inline-навигация по меню
+    dp.register_callback_query_handler(navigate, lambda callback: callback.data.startswith("nav:"), state="*")
+    
+    # Выбор темы для повторения (inline-кнопки с id темы)
+    dp.register_callback_query_handler(start_repeat_lesson, lambda callback: callback.data.startswith("repeat:"), state="*")
     
     # Обработчик всего остального (должен быть последним)
     dp.register_message_handler(handle_unknown)
\ No newline at end of file
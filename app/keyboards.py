@@ -1,4 +1,4 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 # Главное меню
 main_menu = ReplyKeyboardMarkup(
@@ -18,4 +18,36 @@ lesson_keyboard = ReplyKeyboardMarkup(
         [KeyboardButton(text="⬅️ В меню")]
     ],
     resize_keyboard=True
-)
\ No newline at end of file
+)
+
+# Темы для повторения: в callback_data — id темы, а не её название
+def repeat_topics_keyboard(completed, repeating):
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    for topic in completed:
+        keyboard.add(InlineKeyboardButton(text=f"🔄 {topic['topic_name']}", callback_data=f"repeat:{topic['id']}"))
+    for topic in repeating:
+        keyboard.add(InlineKeyboardButton(text=f"🔁 {topic['topic_name']} (повтор)", callback_data=f"repeat:{topic['id']}"))
+    keyboard.add(InlineKeyboardButton(text="⬅️ В меню", callback_data="nav:menu"))
+    return keyboard
+
+# Inline-навигация: меню редактируют одно и то же сообщение (INLINE_NAVIGATION=1)
+main_menu_inline = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="📚 Новый урок", callback_data="nav:lesson"),
+         InlineKeyboardButton(text="📊 Мой прогресс", callback_data="nav:progress")],
+        [InlineKeyboardButton(text="🔄 Повторить тему", callback_data="nav:repeat"),
+         InlineKeyboardButton(text="❓ Помощь", callback_data="nav:help")]
+    ]
+)
+
+back_inline = InlineKeyboardMarkup(
+    inline_keyboard=[[InlineKeyboardButton(text="⬅️ В меню", callback_data="nav:menu")]]
+)
+
+lesson_inline = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="📚 Новый урок", callback_data="nav:lesson")],
+        [InlineKeyboardButton(text="🔄 Повторить тему", callback_data="nav:repeat")],
+        [InlineKeyboardButton(text="⬅️ В меню", callback_data="nav:menu")]
+    ]
+)
@@ -0,0 +1,106 @@
+import heapq
+
+
+class Leaderboard:
+    """Рейтинг по XP в памяти: дерево Фенвика по значениям XP и кэш топ-N.
+
+    Место пользователя = 1 + число пользователей с большим XP, это префиксная
+    сумма по дереву за O(log max_xp). Топ-N обновляется инкрементально.
+    """
+
+    def __init__(self, top_size=10):
+        self.top_size = top_size
+        self._xp = {}          # user_id -> xp
+        self._tree = [0] * 1025  # Фенвик по xp (индекс xp + 1)
+        self._top = []         # [(xp, user_id)] по убыванию
+
+    # --- дерево Фенвика ---
+
+    def _rebuild(self, size):
+        self._tree = [0] * (size + 1)
+        for value in self._xp.values():
+            self._add(value, 1)
+
+    def _grow(self, xp):
+        """Расширяет дерево (удвоением), чтобы в него помещалось значение xp"""
+        size = len(self._tree) - 1
+        if xp + 1 <= size:
+            return
+        while size < xp + 1:
+            size *= 2
+        self._rebuild(size)
+
+    def _add(self, xp, delta):
+        i = xp + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, xp):
+        """Число пользователей с XP <= xp"""
+        i = min(xp + 1, len(self._tree) - 1)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    # --- публичный API ---
+
+    def load(self, rows):
+        """Начальная загрузка из пар (user_id, xp)"""
+        self._xp = {user_id: max(0, xp or 0) for user_id, xp in rows}
+        size = 1024
+        while size < max(self._xp.values(), default=0) + 1:
+            size *= 2
+        self._rebuild(size)
+        self._rebuild_top()
+
+    def update(self, user_id, xp):
+        """Новое значение XP пользователя"""
+        xp = max(0, xp or 0)
+        old = self._xp.get(user_id)
+        if old == xp:
+            return
+        self._grow(xp)
+        if old is not None:
+            self._add(old, -1)
+        self._xp[user_id] = xp
+        self._add(xp, 1)
+        self._update_top(user_id, old, xp)
+
+    def __contains__(self, user_id):
+        return user_id in self._xp
+
+    def __len__(self):
+        return len(self._xp)
+
+    def rank(self, user_id):
+        """Место пользователя (1 — первое) или None"""
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return None
+        return len(self._xp) - self._count_upto(xp) + 1
+
+    def top(self):
+        """Топ-N: [(user_id, xp)]"""
+        return [(user_id, xp) for xp, user_id in self._top]
+
+    # --- кэш топ-N ---
+
+    def _rebuild_top(self):
+        self._top = heapq.nlargest(self.top_size, ((xp, user_id) for user_id, xp in self._xp.items()))
+
+    def _update_top(self, user_id, old, xp):
+        in_top = old is not None and (old, user_id) in self._top
+        if in_top:
+            self._top.remove((old, user_id))
+            if xp < old and len(self._xp) > self.top_size:
+                # Кто-то снаружи мог обогнать — редкий случай, пересобираем
+                self._rebuild_top()
+                return
+        elif len(self._top) >= self.top_size and (xp, user_id) <= self._top[-1]:
+            return
+        self._top.append((xp, user_id))
+        self._top.sort(reverse=True)
+        del self._top[self.top_size:]
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import logging
+
+from app.ai_teacher import generate_lesson
+from app.database import take_cached_lesson, get_cached_variants, save_cached_lesson, run_async
+from app.singleflight import SingleFlight
+from app.llm_guard import teacher, LLMUnavailable, StreamInterrupted
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных вариантов урока держать на одну тему
+LESSON_VARIANTS = int(os.getenv("LESSON_CACHE_VARIANTS", 3))
+
+# Одинаковые одновременные генерации (level, topic, variant) идут одним запросом
+generation_flight = SingleFlight("generate_lesson")
+
+_refilling = set()      # (level, topic), для которых уже идёт дозаполнение
+_background = set()     # ссылки на фоновые задачи, чтобы их не собрал GC
+
+
+async def get_cached_lesson(level, topic):
+    """Урок из кэша (варианты по кругу) или None; недостающие варианты догенерируются в фоне"""
+    lesson = await run_async(take_cached_lesson, level, topic)
+    if lesson is not None:
+        schedule_refill(level, topic)
+    return lesson
+
+
+async def generate_and_cache(level, topic):
+    """Генерирует урок сейчас (промах кэша), сохраняет его и дозаполняет остальные варианты"""
+    variants = await run_async(get_cached_variants, level, topic)
+    variant = _free_variants(variants)[0] if len(variants) < LESSON_VARIANTS else 0
+    lesson = await _generate_variant(level, topic, variant)
+    schedule_refill(level, topic)
+    return lesson
+
+
+async def get_lesson(level, topic):
+    """Урок по теме: из кэша, а при промахе — генерацией"""
+    lesson = await get_cached_lesson(level, topic)
+    if lesson is None:
+        lesson = await generate_and_cache(level, topic)
+    return lesson
+
+
+async def stream_and_cache(level, topic, stream):
+    """Промах кэша с показом урока потоком: stream() генерирует урок, показывая его
+    пользователю. Одновременные промахи по той же теме не запускают свои генерации,
+    а ждут общий результат. Возвращает (урок, показан ли он уже этому вызову)."""
+    variants = await run_async(get_cached_variants, level, topic)
+    variant = _free_variants(variants)[0] if len(variants) < LESSON_VARIANTS else 0
+    streamed = False
+
+    async def generate():
+        nonlocal streamed
+        streamed = True
+        # stream() сам зовёт учителя через teacher.stream — с таймаутом на каждый кусок
+        lesson = await stream()
+        await run_async(save_cached_lesson, level, topic, variant, lesson)
+        return lesson
+    try:
+        lesson = await generation_flight.do((level, topic, variant), generate)
+    except StreamInterrupted:
+        if streamed:
+            raise
+        # Начало оборванного урока видел только тот, кто его генерировал; остальным — запасной
+        raise LLMUnavailable("shared lesson stream broke off")
+    schedule_refill(level, topic)
+    return lesson, streamed
+
+
+def schedule_refill(level, topic):
+    """Запускает фоновое дозаполнение вариантов темы (если их меньше LESSON_VARIANTS)"""
+    key = (level, topic)
+    if key in _refilling:
+        return
+    _refilling.add(key)
+    task = asyncio.create_task(_refill(level, topic))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _generate_variant(level, topic, variant):
+    async def generate():
+        lesson = await teacher.call(generate_lesson, level=level, topic=topic)
+        await run_async(save_cached_lesson, level, topic, variant, lesson)
+        return lesson
+    return await generation_flight.do((level, topic, variant), generate)
+
+
+def _free_variants(variants):
+    return [variant for variant in range(LESSON_VARIANTS) if variant not in variants]
+
+
+async def _refill(level, topic):
+    try:
+        # Сколько вариантов не хватает, выясняется уже в фоне — запрос к базе не держит ответ
+        for variant in _free_variants(await run_async(get_cached_variants, level, topic)):
+            await _generate_variant(level, topic, variant)
+            logger.info(f"Cached lesson variant {variant} for {level}/{topic}")
+    except LLMUnavailable as e:
+        logger.warning(f"Lesson cache refill postponed for {level}/{topic}: {e}")
+    except Exception:
+        logger.exception(f"Lesson cache refill failed for {level}/{topic}")
+    finally:
+        _refilling.discard((level, topic))
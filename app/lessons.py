@@ -0,0 +1,157 @@
+import os
+import re
+import runpy
+import asyncio
+import logging
+import threading
+
+# Хранилище уроков: lessons_db.py весит ~1.4 МБ, поэтому импортируем его лениво,
+# а не при старте процесса.
+
+NUMBERED_LINE_RE = re.compile(r"^\s*\d{1,2}[.)]\s*(.+?)\s*$", re.MULTILINE)
+# Пункты в одну строку: «1. ... 2. ... 3. ...»
+INLINE_NUMBER_RE = re.compile(r"(?:^|\s)\d{1,2}[.)]\s+")
+
+LESSONS_SOURCE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'lessons_db.py')
+
+logger = logging.getLogger(__name__)
+
+
+class LessonSnapshot:
+    """Неизменяемый набор уроков одной версии.
+
+    Обработчик, которому нужно несколько обращений к урокам, берёт снимок
+    один раз (snapshot()) и работает с ним: перезагрузка подменяет снимок
+    целиком и уже выданные не трогает.
+    """
+
+    def __init__(self, version, lessons, index=None):
+        self.version = version
+        self.lessons = sorted(lessons, key=lambda lesson: lesson['id'])
+        self.by_id = {lesson['id']: lesson for lesson in self.lessons}
+        # Поисковый индекс этой версии; None — берётся упакованный lessons_index.json
+        self.index = index
+
+    def __len__(self):
+        return len(self.lessons)
+
+    def get(self, lesson_id):
+        return self.by_id.get(lesson_id)
+
+    def next_after(self, lesson_id):
+        for lesson in self.lessons:
+            if lesson['id'] > lesson_id:
+                return lesson
+        return None
+
+    def by_level(self, levels):
+        return [lesson for lesson in self.lessons if lesson['level'] in levels]
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def snapshot():
+    """Текущий снимок уроков (при первом обращении импортирует lessons_db)"""
+    global _snapshot
+    if _snapshot is not None:
+        return _snapshot
+    with _lock:
+        if _snapshot is None:
+            from lessons_db import lessons
+            _snapshot = LessonSnapshot(1, lessons)
+    return _snapshot
+
+
+def load_lessons():
+    """Загружает уроки из lessons_db (один раз, потокобезопасно)"""
+    return snapshot().lessons
+
+
+def is_loaded():
+    """Загружены ли уроки"""
+    return _snapshot is not None
+
+
+def get_lesson(lesson_id):
+    """Урок по id или None"""
+    return snapshot().get(lesson_id)
+
+
+def get_next_lesson(lesson_id):
+    """Следующий урок после lesson_id или None"""
+    return snapshot().next_after(lesson_id)
+
+
+def get_lessons_count():
+    """Количество уроков"""
+    return len(snapshot())
+
+
+def get_lessons_by_level(levels):
+    """Уроки заданных уровней (по порядку id)"""
+    return snapshot().by_level(levels)
+
+
+def reload_lessons(path=LESSONS_SOURCE):
+    """Перечитывает исходник уроков и атомарно подменяет снимок.
+
+    Долгая часть — проверка, выполнение файла и поисковый индекс — идёт до
+    подмены и без блокировки, поэтому её можно гнать в потоке
+    (asyncio.to_thread). Если исходник не проходит проверку, остаётся старый
+    снимок и выбрасывается ValueError.
+    """
+    global _snapshot
+    from app.validate import validate_source, format_issues
+    from app.search import build_index
+
+    errors = [issue for issue in validate_source(path) if issue.severity == "error"]
+    if errors:
+        raise ValueError(f"{len(errors)} errors in {path}:\n{format_issues(errors[:10])}")
+    lessons = runpy.run_path(path)['lessons']
+    index = build_index(lessons)
+
+    with _lock:
+        version = (_snapshot.version if _snapshot else 0) + 1
+        _snapshot = LessonSnapshot(version, lessons, index)
+    logger.info(f"Lessons reloaded: version {version}, {len(lessons)} lessons")
+    return _snapshot
+
+
+async def watch_lessons(interval, path=LESSONS_SOURCE):
+    """Следит за изменением исходника уроков и перезагружает их вне event loop"""
+    mtime = os.stat(path).st_mtime
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = os.stat(path).st_mtime
+            if current == mtime:
+                continue
+            mtime = current
+            await asyncio.to_thread(reload_lessons, path)
+        except Exception:
+            logger.exception("Lessons reload failed, keeping the previous version")
+
+
+def format_lesson(lesson):
+    """Текст урока для отправки (HTML)"""
+    return (
+        f"📚 <b>Урок {lesson['id']}: {lesson['topic']}</b>\n"
+        f"Уровень: {lesson['level']}\n\n"
+        f"{lesson['theory']}\n\n"
+        f"{lesson['examples']}\n\n"
+        f"{lesson['exercise']}"
+    )
+
+
+def split_exercise(exercise):
+    """(инструкция, пункты) из текста задания «ИНСТРУКЦИЯ\\n\\n1. ...\\n2. ...»"""
+    items = NUMBERED_LINE_RE.findall(exercise)
+    if len(items) < 2:
+        parts = INLINE_NUMBER_RE.split(exercise)
+        if len(parts) > 2:
+            return parts[0].strip(), [part.strip() for part in parts[1:]]
+    first = NUMBERED_LINE_RE.search(exercise)
+    instruction = exercise[:first.start()].strip() if first else exercise.strip()
+    return instruction, items
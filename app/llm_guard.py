@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Не больше LLM_CONCURRENCY одновременных запросов к учителю (LLM)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+# Сколько ждать свободного слота, прежде чем отдать запасной ответ
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 2))
+# Дедлайн одного запроса
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 25))
+# Потоковый ответ: сколько ждать первого куска и каждого следующего (вместо дедлайна на весь ответ)
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", 15))
+
+# Уровни тем из user_topics -> уровни уроков в lessons_db
+TOPIC_LEVELS = {
+    'beginner': ("A0", "A1", "A0-A1", "A1-A2", "A2"),
+    'intermediate': ("A2-B1", "B1", "B1-B2"),
+    'advanced': ("B2", "B2-C1", "C1"),
+}
+
+
+class LLMUnavailable(Exception):
+    """Учитель сейчас недоступен: таймаут, перегрузка или открыт предохранитель"""
+
+
+class StreamInterrupted(LLMUnavailable):
+    """Поток учителя оборвался, когда часть ответа уже получена"""
+
+
+class CircuitBreaker:
+    """Размыкается, когда доля ошибок в последних window вызовах достигает error_rate"""
+
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, cooldown=30):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.results = deque(maxlen=window)
+        self.opened_at = None
+        self.trial_running = False
+        # Поколение растёт при каждом размыкании и пробном вызове: итоги вызовов
+        # из прошлого поколения (начатых до размыкания) не учитываются
+        self.generation = 1
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """Пропуск на вызов учителя (передать в record) или None, если звать нельзя"""
+        state = self.state
+        if state == "closed":
+            return self.generation
+        if state == "half-open" and not self.trial_running:
+            # Один пробный вызов после паузы — со своим поколением
+            self.trial_running = True
+            self.generation += 1
+            return self.generation
+        return None
+
+    def record(self, token, ok):
+        if token != self.generation:
+            # Вызов начался до размыкания — его итог уже ничего не говорит
+            return
+        if self.opened_at is not None:
+            # Итог пробного вызова
+            self.trial_running = False
+            if ok:
+                logger.info("LLM circuit closed")
+                self.opened_at = None
+                self.results.clear()
+            else:
+                self._open()
+            return
+
+        self.results.append(ok)
+        failures = self.results.count(False)
+        if len(self.results) >= self.min_calls and failures / len(self.results) >= self.error_rate:
+            logger.warning(f"LLM circuit opened: {failures}/{len(self.results)} recent calls failed")
+            self._open()
+
+    def cancel(self, token):
+        """Вызов отменён без результата: пробный слот освобождается"""
+        if token == self.generation and self.opened_at is not None:
+            self.trial_running = False
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.generation += 1
+
+
+class GuardedLLM:
+    """Вызовы учителя с ограничением параллельности, дедлайном и предохранителем"""
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, breaker=None, idle_timeout=LLM_STREAM_IDLE_TIMEOUT):
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.BoundedSemaphore(concurrency)
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Место среди одновременных вызовов и пропуск предохранителя"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMUnavailable("too many concurrent LLM calls")
+
+        try:
+            token = self.breaker.allow()
+            if token is None:
+                self.rejected += 1
+                raise LLMUnavailable("LLM circuit is open")
+            yield token
+        finally:
+            self._semaphore.release()
+
+    async def call(self, func, *args, **kwargs):
+        """await func(*args, **kwargs) или LLMUnavailable"""
+        async with self._slot() as token:
+            try:
+                result = await asyncio.wait_for(func(*args, **kwargs), self.timeout)
+            except asyncio.CancelledError:
+                self.breaker.cancel(token)
+                raise
+            except Exception as e:
+                self.breaker.record(token, False)
+                raise LLMUnavailable(f"LLM call failed: {e!r}") from e
+            self.breaker.record(token, True)
+            return result
+
+    async def stream(self, func, *args, **kwargs):
+        """Куски асинхронного генератора func(*args, **kwargs) или LLMUnavailable.
+
+        Дедлайн — не на весь ответ, а на ожидание каждого куска (idle_timeout):
+        длинная, но живая генерация не обрывается. Предохранитель узнаёт итог
+        по первому куску; обрыв после него — StreamInterrupted.
+        """
+        async with self._slot() as token:
+            chunks = func(*args, **kwargs)
+            received = False
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.idle_timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.CancelledError:
+                        if not received:
+                            self.breaker.cancel(token)
+                        raise
+                    except Exception as e:
+                        if received:
+                            raise StreamInterrupted(f"LLM stream broke off: {e!r}") from e
+                        self.breaker.record(token, False)
+                        raise LLMUnavailable(f"LLM call failed: {e!r}") from e
+                    if not received:
+                        received = True
+                        self.breaker.record(token, True)
+                    yield chunk
+            finally:
+                await chunks.aclose()
+            if not received:
+                self.breaker.record(token, False)
+                raise LLMUnavailable("LLM returned an empty response")
+
+    def stats(self):
+        return {'circuit': self.breaker.state, 'rejected': self.rejected}
+
+
+teacher = GuardedLLM()
+
+
+def fallback_lesson(level, topic):
+    """Статический урок из lessons_db того же уровня (по возможности — по той же теме)"""
+    from app.lessons import get_lessons_by_level, get_lesson
+    from app.search import search
+
+    try:
+        levels = TOPIC_LEVELS.get(level, (level,))
+        for lesson_id in search(topic, limit=50):
+            lesson = get_lesson(lesson_id)
+            if lesson and lesson['level'] in levels:
+                return lesson
+        candidates = get_lessons_by_level(levels)
+        return random.choice(candidates) if candidates else None
+    except Exception:
+        logger.exception("Static lesson fallback failed")
+        return None
@@ -0,0 +1,139 @@
+"""Сторож event loop: задержка цикла как метрика и стек кода, который его держит"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Остановка цикла дольше порога (секунды) считается блокировкой; 0 — сторож выключен
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", 0.25))
+# Корзины гистограммы задержки (секунды)
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Файлы проекта: в стеке ищем самый глубокий кадр отсюда — это и есть место блокировки
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopWatchdog:
+    """Измеряет задержку event loop и ловит блокирующие вызовы"""
+
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD):
+        self.threshold = threshold
+        # Корутина должна «пульсировать» чаще порога, иначе поток не отличит сон от блокировки
+        self.interval = min(0.1, threshold / 4)
+        self.buckets = [0] * (len(LAG_BUCKETS) + 1)
+        self.lag_sum = 0.0
+        self.lag_count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.sites = {}            # место -> [остановок, секунд всего, максимум]
+        self.recent = deque(maxlen=20)
+        self._heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._captured = None      # стек, снятый потоком во время текущей остановки
+        self._stopped = threading.Event()
+
+    async def run(self):
+        """Фоновая задача в event loop; заодно запускает поток-сторож"""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                self._record(max(0.0, loop.time() - started - self.interval))
+                self._heartbeat = time.monotonic()
+        finally:
+            self._stopped.set()
+
+    def _record(self, lag):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.lag_sum += lag
+        self.lag_count += 1
+        for i, bound in enumerate(LAG_BUCKETS):
+            if lag <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+        captured, self._captured = self._captured, None
+        if lag < self.threshold:
+            return
+        self.stalls += 1
+        site, stack = captured or ("unknown", "")
+        stats = self.sites.setdefault(site, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += lag
+        stats[2] = max(stats[2], lag)
+        self.recent.append({'at': time.time(), 'lag': round(lag, 4), 'site': site, 'stack': stack})
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {site}\n{stack}")
+
+    def _watch(self):
+        """Поток-сторож: снимает стек цикла, пока тот стоит дольше порога"""
+        while not self._stopped.wait(self.interval):
+            behind = time.monotonic() - self._heartbeat
+            if behind < self.threshold or self._captured is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._captured = _describe(frame)
+
+    def metrics(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP event_loop_lag_seconds Event loop scheduling delay",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(LAG_BUCKETS, self.buckets):
+            cumulative += count
+            lines.append(f'event_loop_lag_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines += [
+            f'event_loop_lag_seconds_bucket{{le="+Inf"}} {self.lag_count}',
+            f"event_loop_lag_seconds_sum {self.lag_sum:.6f}",
+            f"event_loop_lag_seconds_count {self.lag_count}",
+            "# TYPE event_loop_lag_last_seconds gauge",
+            f"event_loop_lag_last_seconds {self.last_lag:.6f}",
+            "# TYPE event_loop_lag_max_seconds gauge",
+            f"event_loop_lag_max_seconds {self.max_lag:.6f}",
+            "# TYPE event_loop_stalls_total counter",
+            f"event_loop_stalls_total {self.stalls}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """Места блокировок — самые долгие в сумме сначала — и последние остановки со стеком"""
+        sites = sorted(self.sites.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'threshold': self.threshold,
+            'stalls': self.stalls,
+            'max_lag': round(self.max_lag, 4),
+            'sites': [
+                {'site': site, 'count': count, 'total': round(total, 4), 'max': round(longest, 4)}
+                for site, (count, total, longest) in sites
+            ],
+            'recent': list(self.recent),
+        }
+
+
+def _describe(frame):
+    """(место, стек): место — самый глубокий кадр из кода проекта"""
+    summary = traceback.extract_stack(frame)
+    site = None
+    for entry in reversed(summary):
+        if entry.filename.startswith(PROJECT_DIR) and "site-packages" not in entry.filename:
+            site = f"{os.path.relpath(entry.filename, PROJECT_DIR)}:{entry.lineno} {entry.name}"
+            break
+    if site is None:
+        entry = summary[-1]
+        site = f"{entry.filename}:{entry.lineno} {entry.name}"
+    return site, "".join(summary.format())
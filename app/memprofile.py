@@ -0,0 +1,116 @@
+import sys
+import tracemalloc
+
+from app.lessons import is_loaded, snapshot
+
+# Именованные снимки tracemalloc для сравнения (держим немного — они сами занимают память)
+MAX_SNAPSHOTS = 5
+_snapshots = {}
+
+
+def start(frames=1):
+    """Включает tracemalloc (frames — глубина стека на каждое выделение)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return status()
+
+
+def stop():
+    """Выключает tracemalloc и забывает снимки"""
+    tracemalloc.stop()
+    _snapshots.clear()
+    return status()
+
+
+def status():
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'traced_current': current,
+        'traced_peak': peak,
+        'snapshots': list(_snapshots),
+    }
+
+
+def take_snapshot(name):
+    """Сохраняет снимок под именем name (самый старый вытесняется)"""
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not running")
+    if name not in _snapshots and len(_snapshots) >= MAX_SNAPSHOTS:
+        del _snapshots[next(iter(_snapshots))]
+    _snapshots[name] = _filtered(tracemalloc.take_snapshot())
+    return status()
+
+
+def top(limit=20, group_by="lineno"):
+    """Места, где выделено больше всего памяти сейчас"""
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not running")
+    stats = _filtered(tracemalloc.take_snapshot()).statistics(group_by)
+    return [_stat(stat) for stat in stats[:limit]]
+
+
+def diff(first, second=None, limit=20, group_by="lineno"):
+    """Рост памяти между снимками first и second (по умолчанию — текущее состояние)"""
+    if first not in _snapshots or (second is not None and second not in _snapshots):
+        raise ValueError(f"unknown snapshot; known: {list(_snapshots)}")
+    later = _snapshots[second] if second else _filtered(tracemalloc.take_snapshot())
+    stats = later.compare_to(_snapshots[first], group_by)
+    return [
+        {**_stat(stat), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+        for stat in stats[:limit]
+    ]
+
+
+def _filtered(snapshot):
+    # Собственные выделения tracemalloc и импорт модулей только мешают
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+
+def _stat(stat):
+    frame = stat.traceback[0]
+    return {'site': f"{frame.filename}:{frame.lineno}", 'size': stat.size, 'count': stat.count}
+
+
+def deep_sizeof(obj, skip=frozenset(), seen=None):
+    """Размер объекта вместе со всем, на что он ссылается (dict/list/tuple/set).
+
+    Объекты с id из skip не считаются — так общие с хранилищем уроки,
+    на которые user_data только ссылается, не раздувают размер.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or id(obj) in skip:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, skip, seen) + deep_sizeof(value, skip, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, skip, seen) for item in obj)
+    return size
+
+
+def user_data_sizes(user_data, limit=20):
+    """Сколько памяти держит context.user_data: всего и по самым тяжёлым пользователям"""
+    lessons = snapshot().lessons if is_loaded() else []
+    shared = frozenset(id(lesson) for lesson in lessons)
+    sizes = []
+    copied_lessons = 0
+    for user_id, data in list(user_data.items()):
+        lesson = data.get('current_lesson')
+        # Урок из хранилища — ссылка; копия (например, от прошлой версии уроков) — отдельная память
+        if lesson is not None and id(lesson) not in shared:
+            copied_lessons += 1
+        sizes.append((deep_sizeof(data, shared), user_id, len(data)))
+    sizes.sort(reverse=True)
+    return {
+        'users': len(sizes),
+        'total_bytes': sum(size for size, _, _ in sizes),
+        'own_lesson_copies': copied_lessons,
+        'lessons_bytes': deep_sizeof(lessons),
+        'top': [{'user_id': user_id, 'bytes': size, 'keys': keys} for size, user_id, keys in sizes[:limit]],
+    }
@@ -0,0 +1,550 @@
+import asyncio
+import datetime
+import logging
+import sqlite3
+import threading
+
+import asyncpg
+
+from app.database import TOPICS, EXPORT_KEYS, LEADERBOARD_SIZE, next_review
+
+logger = logging.getLogger(__name__)
+
+# Схема повторяет SQLite-версию из app/database.py (время — ISO-строки в TEXT),
+# чтобы строки из обоих хранилищ были взаимозаменяемы
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        first_name TEXT,
+        username TEXT,
+        joined_date TEXT,
+        level TEXT DEFAULT 'beginner',
+        total_xp INTEGER DEFAULT 0,
+        current_streak INTEGER DEFAULT 0,
+        best_streak INTEGER DEFAULT 0,
+        last_activity TEXT,
+        last_active_day INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS lessons_progress (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT REFERENCES users (user_id),
+        lesson_topic TEXT,
+        completed INTEGER DEFAULT 0,
+        completed_at TEXT,
+        lesson_id INTEGER,
+        topic_index INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS answers_history (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT REFERENCES users (user_id),
+        lesson_topic TEXT,
+        question TEXT,
+        user_answer TEXT,
+        correct INTEGER,
+        answered_at TEXT,
+        grader TEXT,
+        topic_index INTEGER,
+        lesson_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_topics (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT REFERENCES users (user_id),
+        topic_name TEXT,
+        topic_level TEXT,
+        topic_index INTEGER,
+        status TEXT DEFAULT 'pending',
+        completed_at TEXT,
+        repeat_count INTEGER DEFAULT 0,
+        last_repeated TEXT,
+        ease REAL DEFAULT 2.5,
+        interval_days INTEGER DEFAULT 0,
+        due_at TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS answers_daily (
+        user_id BIGINT,
+        day TEXT,
+        total INTEGER DEFAULT 0,
+        correct INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS generated_lessons (
+        level TEXT,
+        topic TEXT,
+        variant INTEGER,
+        content TEXT,
+        created_at TEXT,
+        served_count INTEGER DEFAULT 0,
+        PRIMARY KEY (level, topic, variant)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS item_stats (
+        lesson_id INTEGER,
+        item INTEGER,
+        attempts INTEGER DEFAULT 0,
+        correct INTEGER DEFAULT 0,
+        PRIMARY KEY (lesson_id, item)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        name TEXT PRIMARY KEY,
+        last_user_id BIGINT DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        blocked INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'running',
+        updated_at TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_users_last_active_day ON users (last_active_day)',
+    'CREATE INDEX IF NOT EXISTS idx_users_total_xp ON users (total_xp)',
+    'CREATE INDEX IF NOT EXISTS idx_answers_user ON answers_history (user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_answers_lesson_id ON answers_history (lesson_id)',
+    'CREATE INDEX IF NOT EXISTS idx_answers_topic_index ON answers_history (topic_index)',
+    'CREATE INDEX IF NOT EXISTS idx_lessons_progress_user ON lessons_progress (user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_user_topics_user_due ON user_topics (user_id, due_at)',
+    'CREATE INDEX IF NOT EXISTS idx_user_topics_due ON user_topics (due_at, user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_user_topics_status ON user_topics (user_id, status, topic_index)',
+]
+
+# Таблицы в порядке переноса из SQLite (сначала users — на неё ссылаются остальные)
+TABLES = ['users', 'lessons_progress', 'answers_history', 'answers_daily', 'user_topics', 'generated_lessons', 'broadcasts', 'item_stats']
+COPY_CHUNK = 5000
+
+
+class PostgresStorage:
+    """Хранилище на PostgreSQL с пулом соединений asyncpg.
+
+    Функции app/database.py синхронные, поэтому пул живёт в собственном
+    потоке со своим event loop: call() ждёт результат оттуда, а call_async()
+    (через database.run_async) отдаёт его обработчикам бота без блокировки.
+    asyncpg подготавливает запросы и кэширует prepared statements на каждом
+    соединении пула, так что горячие запросы не разбираются заново.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="pg-storage", daemon=True)
+        self._thread.start()
+        self.pool = self._submit(self._create_pool())
+
+    async def _create_pool(self):
+        return await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, name, *args, **kwargs):
+        """Синхронно выполняет одноимённый метод хранилища (CLI, пул потоков)"""
+        return self._submit(getattr(self, name)(*args, **kwargs))
+
+    def call_async(self, name, *args, **kwargs):
+        """То же для event loop бота: awaitable, пока запрос идёт в пуле, цикл свободен"""
+        return asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(getattr(self, name)(*args, **kwargs), self.loop)
+        )
+
+    def close(self):
+        self._submit(self.pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    # --- Схема и перенос данных ---
+
+    async def init_db(self):
+        async with self.pool.acquire() as conn:
+            for statement in SCHEMA:
+                await conn.execute(statement)
+
+    async def copy_from_sqlite(self, sqlite_path):
+        """Переносит все таблицы из файла SQLite через COPY; возвращает {таблица: строк}"""
+        source = sqlite3.connect(sqlite_path)
+        copied = {}
+        try:
+            async with self.pool.acquire() as conn:
+                for table in TABLES:
+                    target_columns = await conn.fetch(
+                        'SELECT column_name FROM information_schema.columns WHERE table_name = $1', table
+                    )
+                    target_columns = {row['column_name'] for row in target_columns}
+                    cursor = source.execute(f'SELECT * FROM {table}')
+                    columns = [column[0] for column in cursor.description if column[0] in target_columns]
+                    positions = [i for i, column in enumerate(cursor.description) if column[0] in target_columns]
+                    copied[table] = 0
+                    while True:
+                        rows = cursor.fetchmany(COPY_CHUNK)
+                        if not rows:
+                            break
+                        await conn.copy_records_to_table(
+                            table, records=[[row[i] for i in positions] for row in rows], columns=columns
+                        )
+                        copied[table] += len(rows)
+                    # BIGSERIAL должен продолжать нумерацию после перенесённых id
+                    if 'id' in columns:
+                        await conn.execute(
+                            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+                        )
+        finally:
+            source.close()
+        return copied
+
+    # --- Пользователи, серии, XP ---
+
+    async def _get_or_create_user(self, user_id, first_name, username):
+        async with self.pool.acquire() as conn:
+            user = await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
+            if user:
+                return user, False
+            now = datetime.datetime.now()
+            user = await conn.fetchrow('''
+                INSERT INTO users (user_id, first_name, username, joined_date, last_activity, last_active_day)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING *
+            ''', user_id, first_name, username, now.isoformat(), now.isoformat(), now.date().toordinal())
+            if user is None:
+                # Параллельный запрос успел создать пользователя раньше
+                return await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id), False
+            return user, True
+
+    async def update_streak(self, user_id):
+        now = datetime.datetime.now()
+        today = now.date().toordinal()
+        await self.pool.execute('''
+            UPDATE users
+            SET current_streak = CASE WHEN last_active_day = $1 THEN COALESCE(current_streak, 0) + 1 ELSE 1 END,
+                best_streak = GREATEST(
+                    COALESCE(best_streak, 0),
+                    CASE WHEN last_active_day = $1 THEN COALESCE(current_streak, 0) + 1 ELSE 1 END
+                ),
+                last_active_day = $2, last_activity = $3
+            WHERE user_id = $4 AND (last_active_day IS NULL OR last_active_day < $2)
+        ''', today - 1, today, now.isoformat(), user_id)
+
+    async def reset_broken_streaks(self, today=None):
+        today = (today or datetime.date.today()).toordinal()
+        status = await self.pool.execute(
+            'UPDATE users SET current_streak = 0 WHERE current_streak > 0 AND last_active_day < $1',
+            today - 1
+        )
+        return int(status.split()[-1])
+
+    async def _add_xp(self, user_id, xp_amount):
+        return await self.pool.fetchval(
+            'UPDATE users SET total_xp = total_xp + $1 WHERE user_id = $2 RETURNING total_xp',
+            xp_amount, user_id
+        )
+
+    # Рейтинг — запросами к базе: её делят несколько процессов бота, и рейтинг
+    # в памяти одного из них не видел бы XP, начисленный другими
+
+    async def get_top_users(self):
+        rows = await self.pool.fetch('''
+            SELECT user_id, first_name, username, total_xp FROM users
+            WHERE total_xp IS NOT NULL
+            ORDER BY total_xp DESC, user_id DESC
+            LIMIT $1
+        ''', LEADERBOARD_SIZE)
+        return [dict(row) for row in rows]
+
+    async def get_user_rank(self, user_id):
+        # Место = 1 + число пользователей с большим XP (как в app/leaderboard.py) — по индексу total_xp
+        row = await self.pool.fetchrow('''
+            SELECT (SELECT count(*) FROM users WHERE total_xp > COALESCE(u.total_xp, 0)) + 1 AS rank,
+                   (SELECT count(*) FROM users) AS total
+            FROM users u WHERE user_id = $1
+        ''', user_id)
+        if row is None:
+            return None, await self.pool.fetchval('SELECT count(*) FROM users')
+        return row['rank'], row['total']
+
+    # --- Ответы и прогресс ---
+
+    async def save_answer(self, user_id, user_answer, correct, lesson_id=None, topic_index=None, grader=None):
+        await self.pool.execute('''
+            INSERT INTO answers_history (user_id, lesson_id, topic_index, user_answer, correct, answered_at, grader)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ''', user_id, lesson_id, topic_index, user_answer, 1 if correct else 0,
+            datetime.datetime.now().isoformat(), grader)
+
+    async def complete_lesson(self, user_id, lesson_id=None, topic_index=None):
+        await self.pool.execute('''
+            INSERT INTO lessons_progress (user_id, lesson_id, topic_index, completed, completed_at)
+            VALUES ($1, $2, $3, 1, $4)
+        ''', user_id, lesson_id, topic_index, datetime.datetime.now().isoformat())
+
+    async def get_user_stats(self, user_id):
+        async with self.pool.acquire() as conn:
+            user = await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
+            lessons_count = await conn.fetchval('SELECT COUNT(*) FROM lessons_progress WHERE user_id = $1', user_id)
+            answers = await conn.fetchrow('''
+                SELECT COUNT(*) AS total, SUM(correct) AS correct
+                FROM answers_history WHERE user_id = $1
+            ''', user_id)
+            archived = await conn.fetchrow('''
+                SELECT SUM(total) AS total, SUM(correct) AS correct
+                FROM answers_daily WHERE user_id = $1
+            ''', user_id)
+        return {
+            'user': user,
+            'lessons_count': lessons_count or 0,
+            'total_answers': (answers['total'] or 0) + (archived['total'] or 0),
+            'correct_answers': (answers['correct'] or 0) + (archived['correct'] or 0)
+        }
+
+    # --- Темы ---
+
+    async def init_user_topics(self, user_id):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Блокировка по user_id, чтобы два параллельных /start не создали темы дважды
+                await conn.execute('SELECT pg_advisory_xact_lock($1)', user_id)
+                if await conn.fetchval('SELECT COUNT(*) FROM user_topics WHERE user_id = $1', user_id):
+                    return False
+                await conn.copy_records_to_table(
+                    'user_topics',
+                    records=[
+                        (user_id, topic, level, idx, 'current' if idx == 1 else 'pending')
+                        for idx, topic, level in TOPICS
+                    ],
+                    columns=['user_id', 'topic_name', 'topic_level', 'topic_index', 'status']
+                )
+                return True
+
+    async def get_current_topic(self, user_id):
+        async with self.pool.acquire() as conn:
+            topic = await conn.fetchrow('''
+                SELECT * FROM user_topics
+                WHERE user_id = $1 AND status = 'current'
+                ORDER BY topic_index LIMIT 1
+            ''', user_id)
+            if topic:
+                return topic
+            return await conn.fetchrow('''
+                UPDATE user_topics SET status = 'current'
+                WHERE id = (
+                    SELECT id FROM user_topics
+                    WHERE user_id = $1 AND status = 'pending'
+                    ORDER BY topic_index LIMIT 1
+                )
+                RETURNING *
+            ''', user_id)
+
+    async def complete_topic(self, user_id, topic_id):
+        now = datetime.datetime.now()
+        first_review = now + datetime.timedelta(days=1)
+        await self.pool.execute('''
+            UPDATE user_topics
+            SET status = 'completed', completed_at = $1,
+                interval_days = CASE WHEN due_at IS NULL THEN 1 ELSE interval_days END,
+                due_at = COALESCE(due_at, $2)
+            WHERE id = $3 AND user_id = $4
+        ''', now.isoformat(), first_review.isoformat(), topic_id, user_id)
+
+    async def get_completed_topics(self, user_id):
+        return await self.pool.fetch('''
+            SELECT * FROM user_topics
+            WHERE user_id = $1 AND status = 'completed'
+            ORDER BY topic_index
+        ''', user_id)
+
+    async def get_all_topics(self, user_id):
+        return await self.pool.fetch(
+            'SELECT * FROM user_topics WHERE user_id = $1 ORDER BY topic_index', user_id
+        )
+
+    async def start_repeating_topic(self, user_id, topic_id):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE user_topics SET status = 'pending' WHERE user_id = $1 AND status = 'current'",
+                    user_id
+                )
+                await conn.execute('''
+                    UPDATE user_topics
+                    SET status = 'repeating', repeat_count = repeat_count + 1, last_repeated = $1
+                    WHERE id = $2 AND user_id = $3
+                ''', datetime.datetime.now().isoformat(), topic_id, user_id)
+
+    async def get_topic(self, user_id, topic_id):
+        return await self.pool.fetchrow(
+            'SELECT * FROM user_topics WHERE id = $1 AND user_id = $2', topic_id, user_id
+        )
+
+    async def get_repeat_menu_topics(self, user_id):
+        return await self.pool.fetch('''
+            SELECT * FROM user_topics
+            WHERE user_id = $1 AND status IN ('completed', 'repeating')
+            ORDER BY status, topic_index
+        ''', user_id)
+
+    async def get_next_pending_topic(self, user_id):
+        return await self.pool.fetchrow('''
+            SELECT * FROM user_topics
+            WHERE user_id = $1 AND status = 'pending'
+            ORDER BY topic_index LIMIT 1
+        ''', user_id)
+
+    async def get_repeating_topics(self, user_id):
+        return await self.pool.fetch('''
+            SELECT * FROM user_topics
+            WHERE user_id = $1 AND status = 'repeating'
+            ORDER BY last_repeated
+        ''', user_id)
+
+    async def calculate_progress_percentage(self, user_id):
+        row = await self.pool.fetchrow('''
+            SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE status = 'completed') AS completed
+            FROM user_topics WHERE user_id = $1
+        ''', user_id)
+        if row['total'] > 0:
+            return round(row['completed'] / row['total'] * 100, 2)
+        return 0.0
+
+    async def reset_to_next_topic(self, user_id, current_topic_id):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE user_topics SET status = 'pending' WHERE id = $1 AND user_id = $2",
+                    current_topic_id, user_id
+                )
+                next_topic = await conn.fetchrow('''
+                    SELECT * FROM user_topics
+                    WHERE user_id = $1 AND status = 'pending'
+                    ORDER BY topic_index LIMIT 1
+                ''', user_id)
+                if next_topic:
+                    await conn.execute("UPDATE user_topics SET status = 'current' WHERE id = $1", next_topic['id'])
+                return next_topic
+
+    # --- Интервальные повторения ---
+
+    async def review_topic(self, user_id, topic_id, quality):
+        now = datetime.datetime.now()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                topic = await conn.fetchrow(
+                    'SELECT ease, interval_days FROM user_topics WHERE id = $1 AND user_id = $2 FOR UPDATE',
+                    topic_id, user_id
+                )
+                if not topic:
+                    return None
+                ease, interval_days = next_review(topic['ease'], topic['interval_days'], quality)
+                due_at = now + datetime.timedelta(days=interval_days)
+                await conn.execute('''
+                    UPDATE user_topics
+                    SET ease = $1, interval_days = $2, due_at = $3, last_repeated = $4
+                    WHERE id = $5 AND user_id = $6
+                ''', ease, interval_days, due_at.isoformat(), now.isoformat(), topic_id, user_id)
+                return due_at
+
+    async def get_due_topics(self, user_id, now=None, limit=10):
+        now = now or datetime.datetime.now()
+        return await self.pool.fetch('''
+            SELECT * FROM user_topics
+            WHERE user_id = $1 AND due_at <= $2
+            ORDER BY due_at LIMIT $3
+        ''', user_id, now.isoformat(), limit)
+
+    async def get_users_with_due_reviews(self, day=None):
+        day = day or datetime.date.today()
+        end_of_day = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time())
+        return await self.pool.fetch('''
+            SELECT user_id, COUNT(*) AS due_count FROM user_topics
+            WHERE due_at < $1
+            GROUP BY user_id
+        ''', end_of_day.isoformat())
+
+    # --- Сложность уроков ---
+
+    async def record_item_results(self, lesson_id, results):
+        if not results:
+            return
+        await self.pool.executemany('''
+            INSERT INTO item_stats (lesson_id, item, attempts, correct)
+            VALUES ($1, $2, 1, $3)
+            ON CONFLICT (lesson_id, item) DO UPDATE
+            SET attempts = item_stats.attempts + 1, correct = item_stats.correct + excluded.correct
+        ''', [(lesson_id, item, 1 if correct else 0) for item, correct in results.items()])
+
+    async def get_hardest_items(self, whole_lessons=False, min_attempts=5, limit=50):
+        return await self.pool.fetch(f'''
+            SELECT lesson_id, item, attempts, correct,
+                   1.0 * (attempts - correct) / attempts AS failure_rate
+            FROM item_stats
+            WHERE item {'=' if whole_lessons else '>'} 0 AND attempts >= $1
+            ORDER BY failure_rate DESC, attempts DESC
+            LIMIT $2
+        ''', min_attempts, limit)
+
+    # --- Рассылки ---
+
+    async def get_streak_reminder_users(self, day, after_user_id=0, limit=500):
+        return await self.pool.fetch('''
+            SELECT user_id, first_name, current_streak FROM users
+            WHERE user_id > $1 AND last_active_day = $2 AND current_streak > 0
+            ORDER BY user_id LIMIT $3
+        ''', after_user_id, day - 1, limit)
+
+    async def get_broadcast(self, name):
+        return await self.pool.fetchrow('SELECT * FROM broadcasts WHERE name = $1', name)
+
+    async def save_broadcast(self, name, last_user_id, sent, failed, blocked, status='running'):
+        await self.pool.execute('''
+            INSERT INTO broadcasts (name, last_user_id, sent, failed, blocked, status, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (name) DO UPDATE
+            SET last_user_id = excluded.last_user_id, sent = excluded.sent, failed = excluded.failed,
+                blocked = excluded.blocked, status = excluded.status, updated_at = excluded.updated_at
+        ''', name, last_user_id, sent, failed, blocked, status, datetime.datetime.now().isoformat())
+
+    # --- Выгрузка ---
+
+    async def get_export_page(self, table, after=0, limit=1000):
+        key = EXPORT_KEYS[table]
+        return await self.pool.fetch(
+            f'SELECT * FROM {table} WHERE {key} > $1 ORDER BY {key} LIMIT $2', after, limit
+        )
+
+    # --- Кэш сгенерированных уроков ---
+
+    async def take_cached_lesson(self, level, topic):
+        return await self.pool.fetchval('''
+            UPDATE generated_lessons SET served_count = served_count + 1
+            WHERE (level, topic, variant) = (
+                SELECT level, topic, variant FROM generated_lessons
+                WHERE level = $1 AND topic = $2
+                ORDER BY served_count, variant LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING content
+        ''', level, topic)
+
+    async def get_cached_variants(self, level, topic):
+        rows = await self.pool.fetch(
+            'SELECT variant FROM generated_lessons WHERE level = $1 AND topic = $2', level, topic
+        )
+        return [row['variant'] for row in rows]
+
+    async def save_cached_lesson(self, level, topic, variant, content):
+        await self.pool.execute('''
+            INSERT INTO generated_lessons (level, topic, variant, content, created_at, served_count)
+            VALUES ($1, $2, $3, $4, $5, 0)
+            ON CONFLICT (level, topic, variant) DO UPDATE
+            SET content = excluded.content, created_at = excluded.created_at, served_count = 0
+        ''', level, topic, variant, content, datetime.datetime.now().isoformat())
@@ -0,0 +1,64 @@
+import os
+import random
+
+from app.lessons import load_lessons, split_exercise
+from app.grading import grade_answer
+
+# Сколько вопросов задаёт тест: log2(1050) ≈ 10, после 9 шагов остаётся пара уроков
+PLACEMENT_PROBES = int(os.getenv("PLACEMENT_PROBES", 9))
+
+
+def make_probe(lesson, rng=random):
+    """Вопрос-проба из урока: один пункт задания и ответ к нему (или None)"""
+    answers = lesson.get('answers') or []
+    instruction, items = split_exercise(lesson.get('exercise') or "")
+    # Пункты и ответы должны совпадать один к одному, иначе ответ не проверить
+    if not items or len(items) != len(answers):
+        return None
+    index = rng.randrange(len(items))
+    return {'instruction': instruction, 'item': items[index], 'expected': answers[index]}
+
+
+def start_placement():
+    """Состояние теста: границы бинарного поиска по индексам уроков (храним только числа)"""
+    return {'lo': 0, 'hi': len(load_lessons()) - 1, 'asked': 0, 'index': None, 'expected': None}
+
+
+def next_probe(state):
+    """Следующий вопрос около середины диапазона; None — спрашивать больше нечего"""
+    lessons = load_lessons()
+    # Уроки могли перезагрузиться и стать короче
+    lo, hi = state['lo'], min(state['hi'], len(lessons) - 1)
+    if state['asked'] >= PLACEMENT_PROBES or lo > hi:
+        return None
+    mid = (lo + hi) // 2
+    # Ближайший к середине урок, из которого получается проба
+    for offset in range(hi - lo + 1):
+        for index in (mid + offset, mid - offset):
+            if lo <= index <= hi:
+                probe = make_probe(lessons[index])
+                if probe:
+                    state['index'] = index
+                    state['expected'] = probe['expected']
+                    return {**probe, 'lesson': lessons[index], 'number': state['asked'] + 1}
+    return None
+
+
+def answer_probe(state, answer):
+    """Проверяет ответ на текущий вопрос и сужает диапазон; возвращает, верен ли ответ"""
+    grade = grade_answer(answer, [state['expected']]) if answer else {'correct': False}
+    # Почти верно (опечатка) — тоже знает
+    correct = grade['correct'] is not False
+    if correct:
+        state['lo'] = state['index'] + 1
+    else:
+        state['hi'] = state['index'] - 1
+    state['asked'] += 1
+    state['index'] = state['expected'] = None
+    return correct
+
+
+def placement_lesson(state):
+    """Первый урок, который ученик ещё не знает"""
+    lessons = load_lessons()
+    return lessons[min(state['lo'], len(lessons) - 1)]
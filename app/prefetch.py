@@ -0,0 +1,50 @@
+import os
+import time
+import asyncio
+import logging
+
+from app.lesson_cache import get_lesson
+from app.llm_guard import LLMUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд заранее подготовленный урок ждёт пользователя
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", 1800))
+
+_ready = {}          # user_id -> (topic_id, lesson, expires_at)
+_background = set()  # ссылки на фоновые задачи
+
+
+def prefetch_lesson(user_id, topic):
+    """Готовит в фоне урок по следующей теме, чтобы «Новый урок» отдал его сразу"""
+    _drop_expired()
+    task = asyncio.create_task(_prefetch(user_id, topic['id'], topic['topic_level'], topic['topic_name']))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def take_prefetched(user_id, topic_id):
+    """Заранее подготовленный урок по теме topic_id или None"""
+    entry = _ready.pop(user_id, None)
+    if entry is None:
+        return None
+    ready_topic_id, lesson, expires_at = entry
+    if ready_topic_id != topic_id or expires_at < time.monotonic():
+        return None
+    return lesson
+
+
+async def _prefetch(user_id, topic_id, level, topic_name):
+    try:
+        lesson = await get_lesson(level, topic_name)
+        _ready[user_id] = (topic_id, lesson, time.monotonic() + PREFETCH_TTL)
+    except LLMUnavailable:
+        pass  # урок сгенерируется (или подставится запасной) по нажатию
+    except Exception:
+        logger.exception(f"Prefetch failed for user {user_id}, topic {topic_name}")
+
+
+def _drop_expired():
+    now = time.monotonic()
+    for user_id in [user_id for user_id, entry in _ready.items() if entry[2] < now]:
+        del _ready[user_id]
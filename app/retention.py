@@ -0,0 +1,88 @@
+import os
+import gzip
+import json
+import time
+import logging
+import datetime
+
+from app.database import get_db, STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Ответы старше ANSWERS_RETENTION_DAYS дней сворачиваются в дневные итоги answers_daily
+ANSWERS_RETENTION_DAYS = int(os.getenv("ANSWERS_RETENTION_DAYS", 90))
+# Строк за одну транзакцию и пауза между транзакциями — чтобы не держать запись
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", 500))
+COMPACT_PAUSE = float(os.getenv("COMPACT_PAUSE", 0.05))
+# Куда дописывать сырые строки перед удалением (gzip, JSON по строке); пусто — не архивировать
+ANSWERS_ARCHIVE = os.getenv("ANSWERS_ARCHIVE", "")
+
+
+def compact_answers(retention_days=None, batch_size=None, archive_path=None, pause=None):
+    """Сворачивает старые строки answers_history в answers_daily.
+
+    Работает порциями по batch_size строк, каждая — отдельная короткая
+    транзакция, так что живые записи ответов между ними проходят без ожидания.
+    Возвращает количество свёрнутых строк.
+    """
+    if STORAGE_BACKEND != "sqlite":
+        # Свёртка нужна файлу SQLite; PostgreSQL держит большую историю сам
+        return 0
+    retention_days = ANSWERS_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or COMPACT_BATCH
+    archive_path = ANSWERS_ARCHIVE if archive_path is None else archive_path
+    pause = COMPACT_PAUSE if pause is None else pause
+
+    cutoff = (datetime.date.today() - datetime.timedelta(days=retention_days)).isoformat()
+    compacted = 0
+    while True:
+        rolled = _compact_batch(cutoff, batch_size, archive_path)
+        compacted += rolled
+        if rolled < batch_size:
+            break
+        time.sleep(pause)
+
+    if compacted:
+        logger.info(f"Compacted {compacted} answers older than {cutoff}")
+    return compacted
+
+
+def _compact_batch(cutoff, batch_size, archive_path):
+    with get_db() as conn:
+        # Строки пишутся по времени, поэтому самые старые — в начале по id,
+        # и сканирование останавливается, как только набрана порция
+        rows = conn.execute('''
+            SELECT * FROM answers_history
+            WHERE answered_at < ?
+            ORDER BY id
+            LIMIT ?
+        ''', (cutoff, batch_size)).fetchall()
+        if not rows:
+            return 0
+
+        totals = {}
+        for row in rows:
+            key = (row['user_id'], row['answered_at'][:10])
+            total, correct = totals.get(key, (0, 0))
+            totals[key] = (total + 1, correct + (1 if row['correct'] else 0))
+
+        if archive_path:
+            # Архив пишется до удаления; если транзакция не пройдёт, строки
+            # попадут в архив повторно при следующем запуске, но не потеряются
+            with gzip.open(archive_path, "at", encoding="utf-8") as archive:
+                for row in rows:
+                    archive.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+
+        conn.executemany('''
+            INSERT INTO answers_daily (user_id, day, total, correct)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                total = total + excluded.total,
+                correct = correct + excluded.correct
+        ''', [(user_id, day, total, correct) for (user_id, day), (total, correct) in totals.items()])
+        conn.execute(
+            f'DELETE FROM answers_history WHERE id IN ({",".join("?" * len(rows))})',
+            [row['id'] for row in rows]
+        )
+        conn.commit()
+        return len(rows)
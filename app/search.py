@@ -0,0 +1,137 @@
+import os
+import re
+import math
+import json
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Индекс строится при упаковке (python -m app.cli build-pack) и грузится лениво
+INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'lessons_index.json')
+INDEX_FORMAT = 1
+
+# Поля урока и их веса при ранжировании
+FIELD_WEIGHTS = {"topic": 3.0, "theory": 1.0, "examples": 1.0}
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"[a-zа-я0-9']+")
+
+STOP_WORDS = {
+    # английские
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "about",
+    "is", "are", "be", "it", "this", "that", "i", "you", "he", "she", "we", "they",
+    # русские
+    "и", "в", "во", "на", "с", "со", "к", "по", "о", "об", "про", "для", "не", "что",
+    "это", "как", "а", "но", "или", "из", "у", "за", "от", "до", "же", "ли",
+}
+
+EN_SUFFIXES = ("ing", "ies", "ed", "es", "ly", "s")
+RU_SUFFIXES = (
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев",
+    "ую", "юю", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+)
+MIN_STEM = 3
+
+_index = None
+_lock = threading.Lock()
+
+
+def stem(token):
+    """Грубое отсечение окончаний (русский/английский)"""
+    is_russian = "а" <= token[0] <= "я"
+    suffixes = RU_SUFFIXES if is_russian else EN_SUFFIXES
+    for suffix in suffixes:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """Текст -> список нормализованных термов"""
+    text = text.lower().replace("ё", "е")
+    return [stem(token) for token in TOKEN_RE.findall(text) if token not in STOP_WORDS]
+
+
+def build_index(lessons):
+    """Инвертированный индекс: терм -> [[lesson_id, вес BM25], ...] по убыванию веса"""
+    term_freqs = {}
+    doc_lengths = {}
+    for lesson in lessons:
+        freqs = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(str(lesson.get(field) or "")):
+                freqs[term] = freqs.get(term, 0.0) + weight
+                length += weight
+        term_freqs[lesson['id']] = freqs
+        doc_lengths[lesson['id']] = length
+
+    total = len(doc_lengths) or 1
+    avg_length = sum(doc_lengths.values()) / total or 1.0
+
+    postings = {}
+    for lesson_id, freqs in term_freqs.items():
+        norm = K1 * (1 - B + B * doc_lengths[lesson_id] / avg_length)
+        for term, tf in freqs.items():
+            postings.setdefault(term, []).append((lesson_id, tf * (K1 + 1) / (tf + norm)))
+
+    index = {}
+    for term, entries in postings.items():
+        idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+        entries.sort(key=lambda entry: -entry[1])
+        index[term] = [[lesson_id, round(score * idf, 4)] for lesson_id, score in entries]
+    return index
+
+
+def write_index(lessons, path=INDEX_PATH):
+    """Строит индекс и сохраняет его на диск (шаг упаковки)"""
+    index = build_index(lessons)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"format": INDEX_FORMAT, "lessons": len(lessons), "postings": index}, f, ensure_ascii=False)
+    return len(index)
+
+
+def get_index():
+    """Индекс из файла; если упаковки не было — строится в памяти из уроков"""
+    global _index
+    # После горячей перезагрузки уроков индекс живёт в их снимке
+    from app.lessons import is_loaded, snapshot
+    if is_loaded():
+        reloaded = snapshot().index
+        if reloaded is not None:
+            return reloaded
+    if _index is not None:
+        return _index
+    with _lock:
+        if _index is None:
+            _index = _load_index()
+    return _index
+
+
+def _load_index():
+    try:
+        with open(INDEX_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("format") == INDEX_FORMAT:
+            return data["postings"]
+        logger.warning("Search index format mismatch, rebuilding in memory")
+    except FileNotFoundError:
+        logger.warning("Search index not packed, building in memory")
+    from app.lessons import load_lessons
+    return build_index(load_lessons())
+
+
+def search(query, limit=10):
+    """id уроков по релевантности запросу"""
+    index = get_index()
+    scores = {}
+    for term in set(tokenize(query)):
+        for lesson_id, score in index.get(term, ()):
+            scores[lesson_id] = scores.get(lesson_id, 0.0) + score
+    return [lesson_id for lesson_id, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
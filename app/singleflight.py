@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Одновременные вызовы с одинаковым ключом делят один запрос и его результат"""
+
+    def __init__(self, name, report_every=100):
+        self.name = name
+        self.report_every = report_every
+        self.calls = 0
+        self.executions = 0
+        self._inflight = {}  # key -> Future
+
+    async def do(self, key, func):
+        """Выполняет func() или присоединяется к уже идущему вызову с тем же ключом"""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is None:
+            self.executions += 1
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.debug(f"{self.name}: joined in-flight call {key}")
+
+        if self.report_every and self.calls % self.report_every == 0:
+            logger.info(self.report())
+
+        # shield: отмена одного ожидающего не отменяет общий вызов
+        return await asyncio.shield(future)
+
+    def stats(self):
+        coalesced = self.calls - self.executions
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'coalesced': coalesced,
+            'in_flight': len(self._inflight),
+            'coalescing_ratio': round(coalesced / self.calls, 3) if self.calls else 0.0,
+        }
+
+    def report(self):
+        stats = self.stats()
+        return (
+            f"{self.name}: {stats['calls']} calls, {stats['executions']} upstream, "
+            f"{stats['coalesced']} coalesced ({stats['coalescing_ratio']:.1%})"
+        )
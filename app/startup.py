@@ -0,0 +1,46 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Момент старта процесса (модуль импортируется первым в bot.py)
+PROCESS_START = time.perf_counter()
+
+
+class StartupProfiler:
+    """Замеры времени холодного старта: импорты и фазы инициализации"""
+
+    def __init__(self):
+        self.records = []  # (kind, name, seconds, since_start)
+
+    @contextmanager
+    def measure(self, kind, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            self.records.append((kind, name, finished - started, finished - PROCESS_START))
+
+    def imports(self, name):
+        """Замер блока импортов"""
+        return self.measure("import", name)
+
+    def phase(self, name):
+        """Замер фазы инициализации"""
+        return self.measure("init", name)
+
+    def report(self):
+        """Текстовый отчёт о старте"""
+        lines = ["Startup timing report:"]
+        for kind, name, seconds, since_start in self.records:
+            lines.append(f"  {kind:<6} {name:<28} {seconds * 1000:8.1f} ms  (t+{since_start:.3f}s)")
+        lines.append(f"  total  {time.perf_counter() - PROCESS_START:.3f}s since process start")
+        return "\n".join(lines)
+
+    def log_report(self):
+        logger.info(self.report())
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import logging
+
+import aiohttp
+from aiogram.utils.exceptions import MessageNotModified, CantParseEntities
+
+from app.llm_guard import teacher, StreamInterrupted
+
+logger = logging.getLogger(__name__)
+
+# OpenAI-совместимый API DeepSeek; для локальной проверки можно указать
+# адрес фейкового SSE-сервера, например DEEPSEEK_BASE_URL=http://127.0.0.1:8080
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+# Не чаще одного редактирования сообщения в STREAM_EDIT_INTERVAL секунд
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+TELEGRAM_LIMIT = 4096
+
+
+def lesson_messages(level, topic):
+    """Промпт для генерации урока"""
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Ты — учитель английского для русскоязычных учеников. "
+                "Пиши урок на русском с английскими примерами. "
+                "Для оформления используй только теги <b> и <i>."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Урок по теме «{topic}» для уровня {level}: коротко теория, "
+                "5 примеров с переводом и 5 заданий на перевод с русского на английский."
+            ),
+        },
+    ]
+
+
+def judge_messages(topic, user_answer):
+    """Промпт проверки ответа на сгенерированный урок (эталонных ответов у него нет)"""
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Ты — учитель английского для русскоязычных учеников. Проверь ответ на задание. "
+                "Первое слово ответа — ВЕРНО или НЕВЕРНО (верно, если ошибок нет или они мелкие), "
+                "дальше — короткий разбор на русском. Для оформления используй только теги <b> и <i>."
+            ),
+        },
+        {"role": "user", "content": f"Тема урока: «{topic}».\nОтвет ученика:\n{user_answer}"},
+    ]
+
+
+async def judge_answer(topic, user_answer):
+    """Полный ответ учителя на проверку (вердикт разбирает grading.parse_verdict)"""
+    return "".join([chunk async for chunk in stream_completion(judge_messages(topic, user_answer))])
+
+
+async def stream_completion(messages):
+    """Текст ответа модели по кускам (SSE-поток chat/completions)"""
+    headers = {"Authorization": f"Bearer {os.getenv('DEEPSEEK_API_KEY', '')}"}
+    payload = {"model": DEEPSEEK_MODEL, "messages": messages, "stream": True}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{DEEPSEEK_BASE_URL}/chat/completions", json=payload, headers=headers) as response:
+            response.raise_for_status()
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+def _split_point(text):
+    """Где резать текст длиннее лимита Telegram: по последнему переносу строки"""
+    cut = text.rfind("\n", 0, TELEGRAM_LIMIT)
+    return cut if cut > TELEGRAM_LIMIT // 2 else TELEGRAM_LIMIT
+
+
+def split_message(text):
+    """Текст по частям не длиннее лимита Telegram — так же, как режет потоковая отправка"""
+    parts = []
+    while len(text) > TELEGRAM_LIMIT:
+        cut = _split_point(text)
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text.strip():
+        parts.append(text)
+    return parts
+
+
+async def answer_long(message, text, **kwargs):
+    """Отправляет текст любой длины несколькими сообщениями (клавиатура — у последнего)"""
+    parts = split_message(text)
+    for i, part in enumerate(parts):
+        extra = kwargs if i == len(parts) - 1 else {}
+        try:
+            await message.answer(part, parse_mode="HTML", **extra)
+        except CantParseEntities:
+            # Разрез мог прийтись внутрь тега
+            await message.answer(part, **extra)
+
+
+class ProgressiveMessage:
+    """Сообщение Telegram, которое дописывается по мере генерации.
+
+    Промежуточные правки идут простым текстом (незакрытые HTML-теги ломают
+    разметку), финальная — с parse_mode=HTML. Длиннее 4096 символов —
+    продолжение в новом сообщении.
+    """
+
+    def __init__(self, reply_to, interval=STREAM_EDIT_INTERVAL):
+        self.reply_to = reply_to
+        self.interval = interval
+        self.current = None   # сообщение, которое сейчас редактируем
+        self.text = ""        # текст текущего сообщения
+        self.shown = ""       # что уже показано в текущем сообщении
+        self.parts = []       # завершённые части
+        self.last_edit = 0.0
+
+    async def feed(self, chunk):
+        self.text += chunk
+        while len(self.text) > TELEGRAM_LIMIT:
+            cut = _split_point(self.text)
+            head, self.text = self.text[:cut], self.text[cut:].lstrip("\n")
+            await self._show(head, final=True)
+            self.parts.append(head)
+            self.current, self.shown = None, ""
+        if time.monotonic() - self.last_edit >= self.interval:
+            await self._show(self.text)
+
+    async def finish(self):
+        """Финальная правка; возвращает весь текст"""
+        if self.text.strip():
+            await self._show(self.text, final=True)
+            self.parts.append(self.text)
+        return "\n".join(self.parts)
+
+    async def _show(self, text, final=False):
+        if not text.strip() or (text == self.shown and not final):
+            return
+        parse_mode = "HTML" if final else None
+        try:
+            try:
+                await self._send(text, parse_mode)
+            except CantParseEntities:
+                await self._send(text, None)
+        except MessageNotModified:
+            pass
+        self.shown = text
+        self.last_edit = time.monotonic()
+
+    async def _send(self, text, parse_mode):
+        if self.current is None:
+            self.current = await self.reply_to.answer(text, parse_mode=parse_mode)
+        else:
+            await self.current.edit_text(text, parse_mode=parse_mode)
+
+
+async def stream_lesson(message, level, topic):
+    """Генерирует урок и показывает его пользователю по мере генерации.
+
+    LLMUnavailable — если пользователь ещё ничего не увидел; StreamInterrupted —
+    если начало урока уже показано (тогда запасной урок следом не нужен).
+    """
+    progressive = ProgressiveMessage(message)
+    try:
+        async for chunk in teacher.stream(stream_completion, lesson_messages(level, topic)):
+            await progressive.feed(chunk)
+    except StreamInterrupted:
+        await progressive.feed("\n\n⚠️ Учитель не договорил — урок оборвался. Попробуй запросить его ещё раз.")
+        await progressive.finish()
+        raise
+    return await progressive.finish()
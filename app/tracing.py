@@ -0,0 +1,187 @@
+"""Трассировка обновлений /webhook: спаны разбора, обработчика, базы и Bot API"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import secrets
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Куда выгружать трассы: путь к JSONL-файлу или адрес OTLP/HTTP; пусто — трассировка выключена
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+# Доля трасс, которые выгружаются всегда
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))
+# Трассы длиннее этого (мс) выгружаются вне зависимости от выборки; 0 — только выборка
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 1000))
+ENABLED = bool(TRACE_EXPORT)
+SERVICE_NAME = "neuro-english-bot"
+
+# (трасса, id текущего спана) или None вне трассы
+_current = contextvars.ContextVar("trace_span", default=None)
+_queue = queue.Queue(maxsize=1000)
+_exporter = None
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = secrets.token_hex(16)
+        self.name = name
+        self.spans = []
+        # Обработчики в других потоках добавляют спаны сюда же
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Корневой спан трассы; вне включённой трассировки ничего не делает"""
+    if not ENABLED:
+        yield None
+        return
+    current = Trace(name)
+    token = _current.set((current, None))
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        _current.reset(token)
+        duration = _root(current)['duration_ms']
+        if random.random() < TRACE_SAMPLE_RATE or (TRACE_SLOW_MS and duration >= TRACE_SLOW_MS):
+            _export(current)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Спан внутри текущей трассы; yield — словарь атрибутов (можно дополнять).
+    Вне трассы — пустая операция, поэтому обёртки можно ставить где угодно."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    current, parent_id = parent
+    span_id = secrets.token_hex(8)
+    token = _current.set((current, span_id))
+    started = time.time_ns()
+    clock = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.add({
+            'span_id': span_id,
+            'parent_id': parent_id,
+            'name': name,
+            'start_ns': started,
+            'duration_ms': round((time.perf_counter() - clock) * 1000, 3),
+            'attrs': attrs,
+            'error': error,
+        })
+
+
+def _root(current):
+    return next(record for record in current.spans if record['parent_id'] is None)
+
+
+def current_trace_id():
+    parent = _current.get()
+    return parent[0].trace_id if parent else None
+
+
+def _export(current):
+    global _exporter
+    if _exporter is None:
+        _exporter = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+        _exporter.start()
+    try:
+        _queue.put_nowait(current)
+    except queue.Full:
+        # Коллектор не успевает — лучше потерять трассу, чем задержать ответ
+        logger.warning("Trace export queue is full, dropping trace")
+
+
+def _export_loop():
+    send = _post_otlp if TRACE_EXPORT.startswith(("http://", "https://")) else _write_jsonl
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < 100:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            send(batch)
+        except Exception:
+            logger.exception("Trace export failed")
+
+
+def _write_jsonl(batch):
+    with open(TRACE_EXPORT, "a", encoding="utf-8") as f:
+        for current in batch:
+            # Спаны добавляются по завершении; в файле — по времени начала
+            spans = sorted(current.spans, key=lambda record: record['start_ns'])
+            root = _root(current)
+            f.write(json.dumps({
+                'trace_id': current.trace_id,
+                'name': current.name,
+                'start_ns': root['start_ns'],
+                'duration_ms': root['duration_ms'],
+                'spans': spans,
+            }, ensure_ascii=False, default=str) + "\n")
+
+
+def _post_otlp(batch):
+    spans = [_otlp_span(current.trace_id, record) for current in batch for record in current.spans]
+    body = {'resourceSpans': [{
+        'resource': {'attributes': [_otlp_attr('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+    }]}
+    request = urllib.request.Request(
+        TRACE_EXPORT, data=json.dumps(body, default=str).encode(),
+        headers={'Content-Type': 'application/json'}, method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+
+def _otlp_span(trace_id, record):
+    end_ns = record['start_ns'] + int(record['duration_ms'] * 1_000_000)
+    result = {
+        'traceId': trace_id,
+        'spanId': record['span_id'],
+        'name': record['name'],
+        # SPAN_KIND_SERVER для корня (входящее обновление), INTERNAL для шагов
+        'kind': 1 if record['parent_id'] else 2,
+        'startTimeUnixNano': str(record['start_ns']),
+        'endTimeUnixNano': str(end_ns),
+        'attributes': [_otlp_attr(key, value) for key, value in record['attrs'].items()],
+        # STATUS_CODE_ERROR = 2, STATUS_CODE_OK = 1
+        'status': {'code': 2, 'message': record['error']} if record['error'] else {'code': 1},
+    }
+    if record['parent_id']:
+        result['parentSpanId'] = record['parent_id']
+    return result
+
+
+def _otlp_attr(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
@@ -0,0 +1,182 @@
+"""Проверка исходника уроков (lessons_db.py) перед сборкой пакета.
+
+Исходник не импортируется, а читается как текст за один проход: так
+проверка работает и на файле с синтаксическими ошибками и сообщает, где
+именно лишняя скобка или шов «Продолжение…», а каждый урок-словарь
+разбирается отдельно через ast.literal_eval.
+"""
+import re
+import ast
+import bisect
+from collections import namedtuple
+
+from app.lessons import split_exercise, LESSONS_SOURCE
+
+# Порядок уровней: в порядке id уровни не должны идти назад
+LEVEL_ORDER = ["A0", "A0-A1", "A1", "A1-A2", "A2", "A2-B1", "B1", "B1-B2", "B2", "B2-C1", "C1"]
+REQUIRED_FIELDS = ("id", "level", "topic", "theory", "examples", "exercise", "answers")
+# Поля, которые уходят в Telegram с parse_mode=HTML (см. format_lesson)
+HTML_FIELDS = ("topic", "theory", "examples", "exercise")
+
+# Строки, оборванные строки, комментарии и скобки — всё остальное сканер пропускает
+TOKEN_RE = re.compile(
+    r'(?P<string>"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<broken>["\'][^\n]*)'
+    r'|(?P<comment>#[^\n]*)'
+    r'|(?P<bracket>[\[\](){}])'
+)
+SEAM_RE = re.compile(r"#.*Продолжение")
+# Разметка, которую Telegram понимает; любые другие <, > и & ломают сообщение
+HTML_OK_RE = re.compile(r"</?(?:b|i|u|s|code|pre)>|&(?:amp|lt|gt|quot);")
+HTML_UNSAFE_RE = re.compile(r"[<>&]")
+PAIRS = {")": "(", "]": "[", "}": "{"}
+
+Issue = namedtuple("Issue", "severity line lesson_id message")
+
+
+def validate_source(path=LESSONS_SOURCE):
+    """Все проблемы исходника уроков: список Issue(severity, line, lesson_id, message).
+
+    severity — 'error' (такой пакет собирать нельзя) или 'warning'.
+    """
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    line_starts = [0] + [match.end() for match in re.finditer("\n", source)]
+
+    def line_of(offset):
+        return bisect.bisect_right(line_starts, offset)
+
+    issues = []
+    lessons = []   # (строка, урок)
+    stack = []     # (скобка, смещение)
+    list_closed_at = None
+    outside_reported = False
+
+    for match in TOKEN_RE.finditer(source):
+        token = match.group()
+        offset = match.start()
+        kind = match.lastgroup
+        if kind == "string":
+            continue
+        if kind == "comment":
+            if SEAM_RE.match(token):
+                issues.append(Issue("error", line_of(offset), None, f"шов между частями: {token.strip()[:60]}"))
+            continue
+        if kind == "broken":
+            issues.append(Issue("error", line_of(offset), None, f"незакрытая строка: {token.strip()[:60]}"))
+            # Оборванный урок выбрасываем и продолжаем со следующего
+            while stack and not (len(stack) == 1 and stack[0][0] == "["):
+                stack.pop()
+            continue
+        if token in "([{":
+            if token == "{" and not stack and list_closed_at is not None and not outside_reported:
+                # Об уроках после закрытой скобки сообщаем один раз, с первого
+                issues.append(Issue("error", line_of(offset), None,
+                                    f"уроки вне списка lessons (список закрыт на строке {line_of(list_closed_at)})"))
+                outside_reported = True
+            stack.append((token, offset))
+            continue
+
+        # Закрывающая скобка
+        if not stack or stack[-1][0] != PAIRS[token]:
+            issues.append(Issue("error", line_of(offset), None, f"лишняя закрывающая скобка «{token}»"))
+            continue
+        opener, start = stack.pop()
+        if token == "]" and not stack:
+            list_closed_at = offset
+            outside_reported = False
+        elif token == "}" and (not stack or (len(stack) == 1 and stack[0][0] == "[")):
+            lesson = _parse_lesson(source[start:offset + 1], line_of(start), issues)
+            if lesson is not None:
+                lessons.append((line_of(start), lesson))
+
+    for opener, offset in stack:
+        issues.append(Issue("error", line_of(offset), None, f"незакрытая скобка «{opener}»"))
+
+    _check_lessons(lessons, issues)
+    issues.sort(key=lambda issue: issue.line)
+    return issues
+
+
+def _parse_lesson(text, line, issues):
+    try:
+        lesson = ast.literal_eval(text)
+    except (ValueError, SyntaxError) as e:
+        issues.append(Issue("error", line, None, f"урок не разбирается: {e}"))
+        return None
+    if not isinstance(lesson, dict):
+        issues.append(Issue("error", line, None, "урок — не словарь"))
+        return None
+    return lesson
+
+
+def _check_lessons(lessons, issues):
+    by_id = {}
+    for line, lesson in lessons:
+        lesson_id = lesson.get("id")
+        missing = [field for field in REQUIRED_FIELDS if field not in lesson]
+        if missing:
+            issues.append(Issue("error", line, lesson_id, f"нет полей: {', '.join(missing)}"))
+        if not isinstance(lesson_id, int):
+            issues.append(Issue("error", line, lesson_id, "id не целое число"))
+            continue
+        if lesson_id in by_id:
+            issues.append(Issue("error", line, lesson_id, f"повтор id (первый — на строке {by_id[lesson_id][0]})"))
+            continue
+        by_id[lesson_id] = (line, lesson)
+
+        if lesson.get("level") not in LEVEL_ORDER:
+            issues.append(Issue("error", line, lesson_id, f"неизвестный уровень {lesson.get('level')!r}"))
+
+        answers = lesson.get("answers") or []
+        _, items = split_exercise(lesson.get("exercise") or "")
+        if len(items) != len(answers):
+            issues.append(Issue("error", line, lesson_id,
+                                f"ответов {len(answers)}, а пунктов в задании {len(items)}"))
+
+        for field in HTML_FIELDS:
+            value = lesson.get(field)
+            if isinstance(value, str):
+                unsafe = HTML_UNSAFE_RE.search(HTML_OK_RE.sub("", value))
+                if unsafe:
+                    issues.append(Issue("error", line, lesson_id,
+                                        f"в поле {field} символ «{unsafe.group()}» ломает HTML-разметку"))
+
+    if not by_id:
+        issues.append(Issue("error", 1, None, "не найдено ни одного урока"))
+        return
+
+    ids = sorted(by_id)
+    gaps = _ranges(sorted(set(range(1, ids[-1] + 1)) - set(ids)))
+    if gaps:
+        issues.append(Issue("error", 1, None, f"пропущены id: {gaps}"))
+
+    previous = None
+    for lesson_id in ids:
+        line, lesson = by_id[lesson_id]
+        level = lesson.get("level")
+        if level not in LEVEL_ORDER:
+            continue
+        if previous and LEVEL_ORDER.index(level) < LEVEL_ORDER.index(previous[1]):
+            issues.append(Issue("warning", line, lesson_id,
+                                f"уровень {level} после урока {previous[0]} уровня {previous[1]}"))
+        previous = (lesson_id, level)
+
+
+def _ranges(numbers):
+    """[1, 2, 3, 7] -> '1-3, 7'"""
+    parts = []
+    for number in numbers:
+        if parts and parts[-1][1] == number - 1:
+            parts[-1][1] = number
+        else:
+            parts.append([number, number])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in parts)
+
+
+def format_issues(issues):
+    lines = []
+    for issue in issues:
+        lesson = f" урок {issue.lesson_id}:" if issue.lesson_id is not None else ""
+        lines.append(f"{issue.severity.upper()} строка {issue.line}:{lesson} {issue.message}")
+    return "\n".join(lines)
@@ -1,25 +1,58 @@
 import os
+import html
 import asyncio
+import datetime
 import logging
-import uvicorn
-from starlette.applications import Starlette
-from starlette.responses import Response, PlainTextResponse
-from starlette.routing import Route
-from starlette.requests import Request
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, ContextTypes, MessageHandler, filters, CommandHandler
-
-# Подключаем только базу уроков (ai_teacher больше не нужен)
-from lessons_db import get_lesson, get_next_lesson, get_lessons_count
-from app.database import (
-    get_or_create_user, update_streak, add_xp, save_answer,
-    complete_lesson, get_user_stats
-)
+
+from app.startup import profiler
+
+with profiler.imports("uvicorn + starlette"):
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import Response, PlainTextResponse
+    from starlette.routing import Route
+    from starlette.requests import Request
+    from app.admin import admin_routes
+
+with profiler.imports("python-telegram-bot"):
+    from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+    from telegram.error import BadRequest
+    from telegram.ext import Application, ContextTypes, MessageHandler, filters, CommandHandler, CallbackQueryHandler
+    from telegram.request import HTTPXRequest
+
+# Сами уроки (lessons_db) загружаются лениво — см. app/lessons.py
+with profiler.imports("app.lessons + app.database"):
+    from app.lessons import (
+        get_lesson, get_next_lesson, get_lessons_count, load_lessons, format_lesson,
+        snapshot as lesson_snapshot, watch_lessons
+    )
+    from app.search import search as search_lessons, get_index as get_search_index
+    from app.database import (
+        init_db, get_or_create_user, update_streak, add_xp, save_answer,
+        complete_lesson, get_user_stats, reset_broken_streaks,
+        get_top_users, get_user_rank, record_item_results, run_async
+    )
+    from app.grading import grade_answer, resolve_grade
+    from app.placement import start_placement, next_probe, answer_probe, placement_lesson, PLACEMENT_PROBES
+    from app.retention import compact_answers
+    from app.broadcast import send_streak_reminders, STREAK_REMINDER_HOUR
+    from app.loopwatch import LoopWatchdog, LOOP_LAG_THRESHOLD
+    from app import tracing
 
 # --- Настройки ---
 TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
 RENDER_URL = os.environ["RENDER_EXTERNAL_URL"]
 PORT = int(os.getenv("PORT", 8000))
+# Отложенная инициализация: /health отвечает сразу, уроки и вебхук — в фоне
+DEFERRED_INIT = os.getenv("DEFERRED_INIT", "0") == "1"
+# Период фоновых задач обслуживания (сброс прерванных серий и т.п.)
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", 3600))
+# Раз в столько секунд проверять, не изменился ли lessons_db.py (0 — не следить)
+LESSONS_RELOAD_INTERVAL = float(os.getenv("LESSONS_RELOAD_INTERVAL", 0))
+# Меню на inline-кнопках: переходы редактируют сообщение, а не шлют новое
+INLINE_NAVIGATION = os.getenv("INLINE_NAVIGATION", "0") == "1"
+
+LEVELS = ["A0-A1", "A1-A2", "A2-B1", "B1-B2", "B2-C1"]
 
 # Логирование
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
@@ -41,18 +74,56 @@ def get_lesson_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 def get_level_keyboard():
-    levels = ["A0-A1", "A1-A2", "A2-B1", "B1-B2", "B2-C1"]
-    keyboard = [[KeyboardButton(level)] for level in levels]
+    keyboard = [[KeyboardButton(level)] for level in LEVELS]
     keyboard.append([KeyboardButton("⬅️ В главное меню")])
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def get_placement_keyboard():
+    keyboard = [
+        [KeyboardButton("🤷 Не знаю")],
+        [KeyboardButton("⬅️ В главное меню")]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+def get_main_inline_keyboard():
+    keyboard = [
+        [InlineKeyboardButton("📚 Следующий урок", callback_data="nav:lesson"),
+         InlineKeyboardButton("📊 Мой прогресс", callback_data="nav:progress")],
+        [InlineKeyboardButton("🎯 Выбрать уровень", callback_data="nav:level"),
+         InlineKeyboardButton("❓ Помощь", callback_data="nav:help")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_back_inline_keyboard():
+    return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ В главное меню", callback_data="nav:menu")]])
+
+def get_level_inline_keyboard():
+    keyboard = [[InlineKeyboardButton(level, callback_data=f"level:{level}")] for level in LEVELS]
+    keyboard.append([InlineKeyboardButton("⬅️ В главное меню", callback_data="nav:menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_lesson_inline_keyboard():
+    keyboard = [
+        [InlineKeyboardButton("⬅️ В главное меню", callback_data="nav:leave")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def main_markup():
+    """Клавиатура главного меню для текущего режима навигации"""
+    return get_main_inline_keyboard() if INLINE_NAVIGATION else get_main_keyboard()
+
+def lesson_markup():
+    """Клавиатура под уроком для текущего режима навигации"""
+    return get_lesson_inline_keyboard() if INLINE_NAVIGATION else get_lesson_keyboard()
+
 # --- ОБРАБОТЧИКИ ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"User {user.id} started the bot")
     
     # Сохраняем пользователя в базу
-    get_or_create_user(user.id, user.first_name, user.username)
+    await run_async(get_or_create_user, user.id, user.first_name, user.username)
+    await run_async(update_streak, user.id)
     
     total_lessons = get_lessons_count()
     
@@ -61,46 +132,45 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Привет! Это твой личный AI-учитель английского.\n"
         "У нас есть <b>1050 готовых уроков</b> — от A0 до C1.\n\n"
         "📚 <b>Все уроки созданы по методике Александра Бебриса</b>\n\n"
-        "Нажми <b>«Следующий урок»</b>, чтобы начать!"
+        "Нажми <b>«Следующий урок»</b>, чтобы начать!\n"
+        "Уже знаешь английский? Пройди /placement — подберём урок за пару минут."
     )
     
-    await update.message.reply_text(welcome_text, parse_mode="HTML", reply_markup=get_main_keyboard())
+    await update.message.reply_text(welcome_text, parse_mode="HTML", reply_markup=main_markup())
 
 async def next_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
+    # Начатый тест на уровень прерывается
+    context.user_data.pop('placement', None)
+    
     # Получаем текущий урок пользователя
     current_lesson_id = context.user_data.get('current_lesson_id', 1)
     
-    # Получаем урок из базы
-    lesson = get_lesson(current_lesson_id)
+    # Один снимок уроков на весь обработчик — перезагрузка посреди запроса его не меняет
+    lessons = lesson_snapshot()
+    lesson = lessons.get(current_lesson_id)
     
     if not lesson:
         # Если уроков больше нет
-        total = get_lessons_count()
+        total = len(lessons)
         if current_lesson_id > total:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "🎉 Поздравляю! Ты прошел все 1050 уроков!\n"
                 "Можешь повторить любой уровень через меню «Выбрать уровень».",
-                reply_markup=get_main_keyboard()
+                reply_markup=main_markup()
             )
         else:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "❌ Ошибка загрузки урока. Попробуй позже.",
-                reply_markup=get_main_keyboard()
+                reply_markup=main_markup()
             )
         return
     
     # Формируем сообщение с уроком
-    lesson_text = (
-        f"📚 <b>Урок {lesson['id']}: {lesson['topic']}</b>\n"
-        f"Уровень: {lesson['level']}\n\n"
-        f"{lesson['theory']}\n\n"
-        f"{lesson['examples']}\n\n"
-        f"{lesson['exercise']}"
-    )
+    lesson_text = format_lesson(lesson)
     
-    await update.message.reply_text(lesson_text, parse_mode="HTML", reply_markup=get_lesson_keyboard())
+    await update.effective_message.reply_text(lesson_text, parse_mode="HTML", reply_markup=lesson_markup())
     
     # Сохраняем состояние
     context.user_data['current_lesson_id'] = current_lesson_id
@@ -114,27 +184,30 @@ async def select_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=get_level_keyboard()
     )
 
+def build_level_text(level):
+    # Здесь можно найти первый урок выбранного уровня
+    # (нужно добавить функцию в lessons_db)
+    return f"Ты выбрал уровень {level}. Нажми «Следующий урок», чтобы начать."
+
 async def handle_level_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора уровня"""
     level = update.message.text
     
-    # Здесь можно найти первый урок выбранного уровня
-    # (нужно добавить функцию в lessons_db)
-    
-    await update.message.reply_text(
-        f"Ты выбрал уровень {level}. Нажми «Следующий урок», чтобы начать.",
-        reply_markup=get_main_keyboard()
-    )
+    await update.message.reply_text(build_level_text(level), reply_markup=main_markup())
 
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     user_answer = update.message.text
     
+    if context.user_data.get('placement'):
+        await handle_placement_answer(update, context)
+        return
+    
     # Проверяем, ждем ли мы ответ
     if not context.user_data.get('waiting_for_answer'):
         await update.message.reply_text(
             "Сначала начни урок командой /start или нажми «Следующий урок»",
-            reply_markup=get_main_keyboard()
+            reply_markup=main_markup()
         )
         return
     
@@ -142,29 +215,42 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not lesson:
         await update.message.reply_text(
             "Ошибка: урок не найден",
-            reply_markup=get_main_keyboard()
+            reply_markup=main_markup()
         )
         return
     
-    # Простая проверка (можно усложнить)
-    add_xp(user_id, 10)
-    save_answer(user_id, f"Урок {lesson['id']}", "Задание", user_answer, True)
+    # Локальная проверка по ответам урока; без ответов проверять не по чему — засчитываем
+    answers = lesson.get('answers')
+    grader = None
+    correct = True
+    if answers:
+        grade = grade_answer(user_answer, answers)
+        correct, results = resolve_grade(grade)
+        grader = 'exact' if grade['tier'] == 'exact' else 'local'
+        # Статистика сложности: каждая проверенная попытка, по пунктам
+        await run_async(record_item_results, lesson['id'], results)
+    
+    if correct:
+        await run_async(add_xp, user_id, 10)
+    await run_async(save_answer, user_id, user_answer, correct, lesson_id=lesson['id'], grader=grader)
+    # Серия дней: по ней шлются напоминания (app/broadcast.py)
+    await run_async(update_streak, user_id)
     
     # Переходим к следующему уроку
     next_id = lesson['id'] + 1
     context.user_data['current_lesson_id'] = next_id
     context.user_data['waiting_for_answer'] = False
     
-    await update.message.reply_text(
-        f"✅ <b>Отлично! +10 XP</b>\n\n"
-        f"Твой ответ принят. Можешь переходить к следующему уроку.",
-        parse_mode="HTML",
-        reply_markup=get_main_keyboard()
-    )
+    if correct:
+        text = "✅ <b>Отлично! +10 XP</b>\n\nТвой ответ принят. Можешь переходить к следующему уроку."
+    else:
+        text = "❌ <b>Не совсем.</b>\n\nПравильные ответы:\n" + "\n".join(
+            f"{number}. {html.escape(answer)}" for number, answer in enumerate(answers, start=1)
+        ) + "\n\nМожешь переходить к следующему уроку."
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=main_markup())
 
-async def progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    stats = get_user_stats(user_id)
+async def build_progress_text(user_id, context):
+    stats = await run_async(get_user_stats, user_id)
     user = stats['user']
     
     current = context.user_data.get('current_lesson_id', 1)
@@ -178,67 +264,294 @@ async def progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📚 Всего ответов: {stats['total_answers']}\n\n"
         f"📈 Прогресс по курсу: {current}/{total} уроков ({current/total*100:.1f}%)"
     )
+    return progress_text
+
+async def placement(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Тест на уровень: бинарный поиск по урокам короткими вопросами из их заданий"""
+    context.user_data['waiting_for_answer'] = False
+    context.user_data['placement'] = start_placement()
+    await update.message.reply_text(
+        "🧭 <b>Определим твой уровень</b>\n\n"
+        f"Будет до {PLACEMENT_PROBES} коротких вопросов, каждый следующий — легче или сложнее "
+        "в зависимости от ответа. Не знаешь ответа — нажми «Не знаю».",
+        parse_mode="HTML"
+    )
+    await ask_probe(update, context)
+
+async def ask_probe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    state = context.user_data['placement']
+    probe = next_probe(state)
+    if probe is None:
+        await finish_placement(update, context)
+        return
+    await update.message.reply_text(
+        f"🧭 Вопрос {probe['number']}/{PLACEMENT_PROBES} · уровень {probe['lesson']['level']}\n\n"
+        f"{probe['instruction']}\n\n{probe['item']}",
+        reply_markup=get_placement_keyboard()
+    )
+
+async def handle_placement_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    answer = update.message.text
+    answer_probe(context.user_data['placement'], None if answer == "🤷 Не знаю" else answer)
+    await ask_probe(update, context)
+
+async def finish_placement(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lesson = placement_lesson(context.user_data.pop('placement'))
+    context.user_data['current_lesson_id'] = lesson['id']
+    await update.message.reply_text(
+        "✅ <b>Тест пройден!</b>\n\n"
+        f"Начнём с урока {lesson['id']}: {html.escape(lesson['topic'])} (уровень {lesson['level']}).\n"
+        "Нажми «Следующий урок», чтобы начать.",
+        parse_mode="HTML",
+        reply_markup=main_markup()
+    )
+
+async def progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    progress_text = await build_progress_text(update.effective_user.id, context)
+    await update.message.reply_text(progress_text, parse_mode="HTML", reply_markup=main_markup())
+
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рейтинг по XP"""
+    user_id = update.effective_user.id
+    leaders = await run_async(get_top_users)
+    rank, total = await run_async(get_user_rank, user_id)
+    
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = ["🏆 <b>Рейтинг по XP</b>\n"]
+    for place, leader in enumerate(leaders, start=1):
+        name = html.escape(leader['first_name'] or leader['username'] or "Без имени")
+        marker = " ← ты" if leader['user_id'] == user_id else ""
+        lines.append(f"{medals.get(place, f'{place}.')} {name} — {leader['total_xp']} XP{marker}")
     
-    await update.message.reply_text(progress_text, parse_mode="HTML", reply_markup=get_main_keyboard())
+    if rank:
+        lines.append(f"\n📍 Твоё место: <b>{rank}</b> из {total}")
+    
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML", reply_markup=main_markup())
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    help_text = (
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск уроков: /search present perfect"""
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text(
+            "🔎 Напиши, что искать: <code>/search present perfect</code>",
+            parse_mode="HTML",
+            reply_markup=main_markup()
+        )
+        return
+    
+    # Первый поиск может строить индекс (если упаковки нет) — не в event loop
+    lesson_ids = await asyncio.to_thread(search_lessons, query)
+    if not lesson_ids:
+        await update.message.reply_text("🔎 Ничего не нашлось", reply_markup=main_markup())
+        return
+    
+    lines = [f"🔎 <b>Найдено по запросу «{html.escape(query)}»:</b>\n"]
+    for lesson_id in lesson_ids:
+        lesson = get_lesson(lesson_id)
+        if lesson:
+            lines.append(f"📚 Урок {lesson['id']} ({lesson['level']}): {html.escape(lesson['topic'])}")
+    
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML", reply_markup=main_markup())
+
+def build_help_text():
+    return (
         "🔍 <b>Помощь</b>\n\n"
         "📚 <b>Следующий урок</b> — начать новый урок\n"
         "🎯 <b>Выбрать уровень</b> — перейти к конкретному уровню\n"
         "📊 <b>Мой прогресс</b> — статистика\n"
+        "🏆 /top — рейтинг по XP\n"
+        "🔎 /search — поиск уроков по теме\n"
+        "🧭 /placement — тест на уровень: с какого урока начать\n"
         "❓ <b>Помощь</b> — эта справка\n\n"
         f"Всего {get_lessons_count()} уроков, разбитых по уровням от A0 до C1.\n"
         "В каждом уроке: теория, примеры и задания на перевод.\n\n"
         "Методика Александра Бебриса: последовательное изучение с наслоением материала ."
     )
-    
-    await update.message.reply_text(help_text, parse_mode="HTML", reply_markup=get_main_keyboard())
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(build_help_text(), parse_mode="HTML", reply_markup=main_markup())
 
 async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['waiting_for_answer'] = False
+    context.user_data.pop('placement', None)
     await update.message.reply_text(
         "👋 Возвращаюсь в главное меню",
-        reply_markup=get_main_keyboard()
+        reply_markup=main_markup()
     )
 
+async def navigate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-навигация: меню, прогресс и выбор уровня редактируют то же сообщение.
+    
+    Уроки по-прежнему приходят новыми сообщениями.
+    """
+    query = update.callback_query
+    await query.answer()
+    
+    if query.data == "nav:lesson":
+        await next_lesson(update, context)
+        return
+    if query.data == "nav:leave":
+        # Выход из урока: урок остаётся в чате, меню — новым сообщением под ним
+        context.user_data['waiting_for_answer'] = False
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("👋 Главное меню", reply_markup=get_main_inline_keyboard())
+        return
+    
+    if query.data == "nav:progress":
+        text = await build_progress_text(update.effective_user.id, context)
+        markup = get_back_inline_keyboard()
+    elif query.data == "nav:help":
+        text, markup = build_help_text(), get_back_inline_keyboard()
+    elif query.data == "nav:level":
+        text, markup = "🎯 Выбери уровень:", get_level_inline_keyboard()
+    elif query.data.startswith("level:"):
+        level = query.data.split(":", 1)[1]
+        text, markup = build_level_text(level), get_main_inline_keyboard()
+    else:
+        context.user_data['waiting_for_answer'] = False
+        text, markup = "👋 Главное меню", get_main_inline_keyboard()
+    
+    try:
+        await query.edit_message_text(text, parse_mode="HTML", reply_markup=markup)
+    except BadRequest as e:
+        # Повторное нажатие той же кнопки — текст не изменился
+        if "not modified" not in str(e).lower():
+            raise
+
+class TracedRequest(HTTPXRequest):
+    """Каждый запрос к Bot API — спан telegram.<метод> в трассе обновления"""
+    async def do_request(self, url, method, *args, **kwargs):
+        with tracing.span(f"telegram.{url.rsplit('/', 1)[-1]}") as attrs:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+            if attrs is not None:
+                attrs['http.status_code'] = status
+            return status, payload
+
 # --- ОСНОВНАЯ ФУНКЦИЯ ---
-async def main():
-    bot_app = Application.builder().token(TOKEN).updater(None).build()
+def build_application():
+    builder = Application.builder().token(TOKEN).updater(None)
+    if tracing.ENABLED:
+        # Размер пула — как у запроса по умолчанию в ApplicationBuilder
+        builder = builder.request(TracedRequest(connection_pool_size=256))
+    bot_app = builder.build()
     
     # Добавляем обработчики
     bot_app.add_handler(CommandHandler("start", start))
+    bot_app.add_handler(CommandHandler("top", top))
+    bot_app.add_handler(CommandHandler("search", search))
+    bot_app.add_handler(CommandHandler("placement", placement))
+    bot_app.add_handler(CallbackQueryHandler(navigate, pattern="^(nav|level):"))
     bot_app.add_handler(MessageHandler(filters.Text("📚 Следующий урок"), next_lesson))
     bot_app.add_handler(MessageHandler(filters.Text("🎯 Выбрать уровень"), select_level))
-    bot_app.add_handler(MessageHandler(filters.Regex('^(A0-A1|A1-A2|A2-B1|B1-B2|B2-C1)$'), handle_level_choice))
+    bot_app.add_handler(MessageHandler(filters.Regex(f"^({'|'.join(LEVELS)})$"), handle_level_choice))
     bot_app.add_handler(MessageHandler(filters.Text("📊 Мой прогресс"), progress))
     bot_app.add_handler(MessageHandler(filters.Text("❓ Помощь"), help_command))
     bot_app.add_handler(MessageHandler(filters.Text("⬅️ В главное меню"), back_to_menu))
     bot_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_answer))
-    
-    # Устанавливаем вебхук
+    return bot_app
+
+async def ensure_webhook(bot):
+    """Ставит вебхук, только если getWebhookInfo показывает другой адрес"""
     webhook_url = f"{RENDER_URL}/webhook"
-    await bot_app.bot.set_webhook(url=webhook_url, allowed_updates=Update.ALL_TYPES)
+    info = await bot.get_webhook_info()
+    allowed = set(info.allowed_updates or Update.ALL_TYPES)
+    if info.url == webhook_url and allowed == set(Update.ALL_TYPES):
+        logger.info(f"Webhook already set to {webhook_url}, skipping set_webhook")
+        return
+    await bot.set_webhook(url=webhook_url, allowed_updates=Update.ALL_TYPES)
     logger.info(f"Webhook set to {webhook_url}")
+
+async def maintenance_loop(bot):
+    """Периодические пакетные задачи, чтобы не делать их на каждое сообщение"""
+    while True:
+        try:
+            reset = await asyncio.to_thread(reset_broken_streaks)
+            if reset:
+                logger.info(f"Reset {reset} broken streaks")
+            await asyncio.to_thread(compact_answers)
+        except Exception:
+            logger.exception("Maintenance failed")
+        # Рассылка помечается выполненной на день, после перезапуска — продолжается
+        if datetime.datetime.now().hour >= STREAK_REMINDER_HOUR:
+            try:
+                await send_streak_reminders(bot)
+            except Exception:
+                logger.exception("Streak reminders failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+async def main():
+    with profiler.phase("build application"):
+        bot_app = build_application()
+    bot_ready = asyncio.Event()
+    # Ошибка фоновой инициализации: после неё /health отвечает 503, и платформа перезапускает сервис
+    init_error = None
+    maintenance_tasks = []
+    # Сторож запускается до инициализации: блокировки на старте тоже видны
+    watchdog = LoopWatchdog() if LOOP_LAG_THRESHOLD else None
+    if watchdog:
+        maintenance_tasks.append(asyncio.create_task(watchdog.run()))
+    
+    async def initialize():
+        with profiler.phase("init_db"):
+            await asyncio.to_thread(init_db)
+        with profiler.phase("load lessons"):
+            await asyncio.to_thread(load_lessons)
+        with profiler.phase("search index"):
+            # Без lessons_index.json индекс строится из уроков — заранее и вне event loop
+            await asyncio.to_thread(get_search_index)
+        with profiler.phase("bot initialize"):
+            await bot_app.initialize()
+        with profiler.phase("webhook"):
+            await ensure_webhook(bot_app.bot)
+        with profiler.phase("bot start"):
+            await bot_app.start()
+        maintenance_tasks.append(asyncio.create_task(maintenance_loop(bot_app.bot)))
+        if LESSONS_RELOAD_INTERVAL:
+            maintenance_tasks.append(asyncio.create_task(watch_lessons(LESSONS_RELOAD_INTERVAL)))
+        bot_ready.set()
+        profiler.log_report()
     
     # Starlette приложение
     async def webhook(request: Request) -> Response:
-        try:
-            data = await request.json()
-            update = Update.de_json(data, bot_app.bot)
-            await bot_app.process_update(update)
-            return Response()
-        except Exception as e:
-            logger.exception("Error processing webhook")
-            return Response(status_code=500)
+        if init_error is not None:
+            return Response(status_code=503)
+        # В режиме отложенной инициализации ждём, пока бот поднимется
+        if not bot_ready.is_set():
+            try:
+                await asyncio.wait_for(bot_ready.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                return Response(status_code=503)
+        with tracing.trace("webhook") as root:
+            try:
+                with tracing.span("decode"):
+                    data = await request.json()
+                    update = Update.de_json(data, bot_app.bot)
+                if root is not None:
+                    root['update_id'] = update.update_id
+                    root['user_id'] = update.effective_user.id if update.effective_user else 0
+                with tracing.span("dispatch"):
+                    await bot_app.process_update(update)
+                return Response()
+            except Exception as e:
+                logger.exception("Error processing webhook")
+                return Response(status_code=500)
     
     async def health_check(request: Request) -> PlainTextResponse:
+        if init_error is not None:
+            return PlainTextResponse("Init failed", status_code=503)
         return PlainTextResponse("OK")
     
+    def log_init_failure(task):
+        nonlocal init_error
+        if not task.cancelled() and task.exception() is not None:
+            init_error = task.exception()
+            logger.error("Background init failed", exc_info=init_error)
+    
     starlette_app = Starlette(routes=[
         Route("/webhook", webhook, methods=["POST"]),
         Route("/health", health_check, methods=["GET"]),
         Route("/healthcheck", health_check, methods=["GET"]),
+        *admin_routes(lambda: bot_app.user_data, watchdog),
     ])
     
     server = uvicorn.Server(
@@ -250,11 +563,22 @@ async def main():
         )
     )
     
+    if DEFERRED_INIT:
+        logger.info("Deferred init: lessons and webhook are loaded in background")
+        init_task = asyncio.create_task(initialize())
+        init_task.add_done_callback(log_init_failure)
+    else:
+        await initialize()
+    
     logger.info(f"Server starting on port {PORT}")
-    async with bot_app:
-        await bot_app.start()
+    try:
         await server.serve()
-        await bot_app.stop()
+    finally:
+        for task in maintenance_tasks:
+            task.cancel()
+        if bot_ready.is_set():
+            await bot_app.stop()
+        await bot_app.shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
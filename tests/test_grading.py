@@ -0,0 +1,74 @@
+"""Локальная проверка ответов: уровни grade_answer, итог resolve_grade, вердикт учителя"""
+import unittest
+
+from app.grading import grade_answer, resolve_grade, parse_verdict, split_items
+
+EXPECTED = ["I am a student", "She is happy", "They are here"]
+
+
+class GradeAnswerTest(unittest.TestCase):
+
+    def test_exact_match_in_any_layout(self):
+        for answer in (
+            "I am a student. She is happy. They are here.",
+            "1) I am a student 2) she is happy 3) they are here",
+            "i'm a student\nshe's happy\nthey're here",
+        ):
+            grade = grade_answer(answer, EXPECTED)
+            self.assertEqual((grade['correct'], grade['tier']), (True, 'exact'), answer)
+
+    def test_typo_is_local_pass(self):
+        grade = grade_answer("1. I am a studen 2. She is happy 3. They are here", EXPECTED)
+        self.assertEqual((grade['correct'], grade['tier']), (True, 'local'))
+
+    def test_wrong_items_are_local_fail(self):
+        grade = grade_answer("1. I am a student 2. Xyz qwe 3. Foo bar baz", EXPECTED)
+        self.assertEqual((grade['correct'], grade['tier']), (False, 'local'))
+        self.assertEqual(grade['items'], [True, False, False])
+
+    def test_empty_or_not_english_fails_without_teacher(self):
+        for answer in ("", "   ", "Я студент"):
+            self.assertEqual(grade_answer(answer, EXPECTED)['tier'], 'local')
+            self.assertFalse(grade_answer(answer, EXPECTED)['correct'])
+
+    def test_unclear_answers_go_to_teacher(self):
+        # Не разбить на пункты или есть пункт «не ясно»
+        self.assertEqual(grade_answer("Hello world", EXPECTED)['tier'], 'llm')
+        self.assertEqual(grade_answer("I am a student; she is sad; they are here", EXPECTED)['tier'], 'llm')
+        # Сгенерированный урок: эталона нет вовсе
+        self.assertEqual(grade_answer("I am", None)['tier'], 'llm')
+
+    def test_split_items(self):
+        self.assertEqual(split_items("One. Two! Three?", 3), ["One.", "Two!", "Three?"])
+        self.assertEqual(split_items("a, b", 2), ["a", " b"])
+        self.assertEqual(split_items("anything", 1), ["anything"])
+
+
+class ResolveGradeTest(unittest.TestCase):
+
+    def test_settled_grade_is_kept(self):
+        grade = grade_answer("1. I am a student 2. Xyz qwe 3. Foo bar baz", EXPECTED)
+        self.assertEqual(resolve_grade(grade), (False, {0: False, 1: True, 2: False, 3: False}))
+
+    def test_near_miss_items_count_as_correct(self):
+        grade = grade_answer("I am a student; she is sad; they are here", EXPECTED)
+        self.assertEqual(resolve_grade(grade), (True, {0: True, 1: True, 2: True, 3: True}))
+
+    def test_unsplittable_answer_is_not_correct(self):
+        self.assertEqual(resolve_grade(grade_answer("Hello world", EXPECTED)), (False, {0: False}))
+
+
+class ParseVerdictTest(unittest.TestCase):
+
+    def test_verdicts(self):
+        self.assertEqual(parse_verdict("ВЕРНО. Всё правильно"), (True, "Всё правильно"))
+        self.assertEqual(parse_verdict("<b>Неверно</b> — нужно am"), (False, "нужно am"))
+        self.assertEqual(parse_verdict("НЕВЕРНО"), (False, ""))
+
+    def test_no_verdict(self):
+        self.assertEqual(parse_verdict("Неверный порядок слов"), (None, "Неверный порядок слов"))
+        self.assertEqual(parse_verdict(""), (None, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Сложность уроков по пунктам заданий (item_stats) на временной SQLite-базе"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import database
+from app.grading import grade_answer, resolve_grade
+
+EXPECTED = ["I am a student", "She is happy", "They are here"]
+
+
+@unittest.skipUnless(database.STORAGE_BACKEND == "sqlite", "проверка SQLite-хранилища")
+class ItemStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(database, "DB_PATH", os.path.join(directory.name, "bot_data.db"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        database.init_db()
+
+    def test_failure_rates_per_item(self):
+        database.record_item_results(7, {0: False, 1: True, 2: False})
+        database.record_item_results(7, {0: True, 1: True, 2: True})
+        database.record_item_results(8, {0: False, 1: False})
+
+        items = {(row['lesson_id'], row['item']): row['failure_rate']
+                 for row in database.get_hardest_items(min_attempts=1)}
+        self.assertEqual(items, {(7, 1): 0.0, (7, 2): 0.5, (8, 1): 1.0})
+        # Самые сложные — первыми
+        self.assertEqual(database.get_hardest_items(min_attempts=1)[0]['lesson_id'], 8)
+
+        lessons = {row['lesson_id']: row['failure_rate']
+                   for row in database.get_hardest_items(whole_lessons=True, min_attempts=1)}
+        self.assertEqual(lessons, {7: 0.5, 8: 1.0})
+
+    def test_min_attempts_filters_rare_items(self):
+        database.record_item_results(7, {0: False, 1: False})
+        self.assertEqual(database.get_hardest_items(min_attempts=2), [])
+
+    def test_graded_answer_is_counted_per_item(self):
+        _, results = resolve_grade(grade_answer("1. I am a student 2. Xyz qwe 3. Foo bar baz", EXPECTED))
+        database.record_item_results(7, results)
+        rows = database.get_hardest_items(min_attempts=1)
+        self.assertEqual({row['item']: row['correct'] for row in rows}, {1: 1, 2: 0, 3: 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
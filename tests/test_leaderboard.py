@@ -0,0 +1,65 @@
+"""Рейтинг по XP в памяти: места по дереву Фенвика и кэш топ-N"""
+import random
+import unittest
+
+from app.leaderboard import Leaderboard
+
+
+def expected_rank(xp, user_id):
+    return 1 + sum(value > xp[user_id] for value in xp.values())
+
+
+def expected_top(xp, size):
+    return [(user_id, value) for value, user_id in sorted(((v, u) for u, v in xp.items()), reverse=True)[:size]]
+
+
+class LeaderboardTest(unittest.TestCase):
+
+    def test_rank_and_top_after_load(self):
+        board = Leaderboard(top_size=2)
+        board.load([(1, 10), (2, 30), (3, 20), (4, None)])
+        self.assertEqual(len(board), 4)
+        self.assertEqual([board.rank(user_id) for user_id in (2, 3, 1, 4)], [1, 2, 3, 4])
+        self.assertEqual(board.top(), [(2, 30), (3, 20)])
+        self.assertIsNone(board.rank(99))
+        self.assertNotIn(99, board)
+
+    def test_ties_share_a_place(self):
+        board = Leaderboard()
+        board.load([(1, 50), (2, 50), (3, 10)])
+        self.assertEqual((board.rank(1), board.rank(2), board.rank(3)), (1, 1, 3))
+
+    def test_update_moves_user_in_and_out_of_top(self):
+        board = Leaderboard(top_size=2)
+        board.load([(1, 10), (2, 20), (3, 30)])
+        board.update(1, 40)
+        self.assertEqual(board.top(), [(1, 40), (3, 30)])
+        self.assertEqual(board.rank(2), 3)
+        # Ушёл вниз из топа — его место занимает тот, кто был снаружи
+        board.update(1, 0)
+        self.assertEqual(board.top(), [(3, 30), (2, 20)])
+        board.update(4, 25)
+        self.assertEqual(board.top(), [(3, 30), (4, 25)])
+        self.assertEqual(len(board), 4)
+
+    def test_grows_past_initial_tree_size(self):
+        board = Leaderboard()
+        board.load([(1, 5)])
+        board.update(2, 100000)
+        self.assertEqual((board.rank(2), board.rank(1)), (1, 2))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        board = Leaderboard(top_size=5)
+        xp = {user_id: rng.randrange(500) for user_id in range(50)}
+        board.load(xp.items())
+        for _ in range(500):
+            user_id = rng.randrange(60)
+            xp[user_id] = max(0, xp.get(user_id, 0) + rng.randrange(-100, 300))
+            board.update(user_id, xp[user_id])
+            self.assertEqual(board.rank(user_id), expected_rank(xp, user_id))
+            self.assertEqual(board.top(), expected_top(xp, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Предохранитель и ограничения вызовов учителя (app/llm_guard.py)"""
+import asyncio
+import unittest
+
+from app.llm_guard import CircuitBreaker, GuardedLLM, LLMUnavailable, StreamInterrupted
+
+
+def cooled(breaker):
+    """Пауза после размыкания прошла"""
+    breaker.opened_at -= breaker.cooldown
+    return breaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def make_open(self):
+        breaker = CircuitBreaker(window=4, min_calls=2, error_rate=0.5, cooldown=30)
+        for _ in range(2):
+            breaker.record(breaker.allow(), False)
+        self.assertEqual(breaker.state, "open")
+        return breaker
+
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5)
+        for ok in (True, False, True):
+            breaker.record(breaker.allow(), ok)
+        self.assertEqual(breaker.state, "closed")
+        breaker.record(breaker.allow(), False)
+        self.assertEqual(breaker.state, "open")
+        self.assertIsNone(breaker.allow())
+
+    def test_single_half_open_trial(self):
+        breaker = cooled(self.make_open())
+        self.assertEqual(breaker.state, "half-open")
+        trial = breaker.allow()
+        self.assertIsNotNone(trial)
+        self.assertIsNone(breaker.allow())
+
+        breaker.record(trial, True)
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.allow(), trial)
+
+    def test_failed_trial_reopens(self):
+        breaker = cooled(self.make_open())
+        breaker.record(breaker.allow(), False)
+        self.assertEqual(breaker.state, "open")
+
+    def test_stale_results_are_ignored(self):
+        breaker = CircuitBreaker(window=4, min_calls=2, error_rate=0.5)
+        slow = breaker.allow()
+        for _ in range(2):
+            breaker.record(breaker.allow(), False)
+        trial = cooled(breaker).allow()
+        # Вызов, начатый до размыкания, не закрывает и не размыкает предохранитель
+        breaker.record(slow, True)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.trial_running)
+        breaker.record(trial, True)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_cancelled_trial_frees_the_slot(self):
+        breaker = cooled(self.make_open())
+        breaker.cancel(breaker.allow())
+        self.assertIsNotNone(breaker.allow())
+
+
+async def chunks(delays, fail_at=None):
+    for i, delay in enumerate(delays):
+        await asyncio.sleep(delay)
+        if i == fail_at:
+            raise RuntimeError("connection reset")
+        yield str(i)
+
+
+class GuardedLLMTest(unittest.IsolatedAsyncioTestCase):
+
+    def make(self, **kwargs):
+        return GuardedLLM(breaker=CircuitBreaker(min_calls=1, error_rate=0.5), **kwargs)
+
+    async def test_call_timeout_counts_as_failure(self):
+        guard = self.make(timeout=0.01)
+        with self.assertRaises(LLMUnavailable):
+            await guard.call(asyncio.sleep, 1)
+        self.assertEqual(guard.breaker.state, "open")
+        with self.assertRaisesRegex(LLMUnavailable, "circuit is open"):
+            await guard.call(asyncio.sleep, 0)
+        self.assertEqual(guard.stats()['rejected'], 1)
+
+    async def test_concurrency_limit(self):
+        guard = self.make(concurrency=1, queue_timeout=0.01)
+        busy = asyncio.create_task(guard.call(asyncio.sleep, 0.1))
+        await asyncio.sleep(0)
+        with self.assertRaisesRegex(LLMUnavailable, "concurrent"):
+            await guard.call(asyncio.sleep, 0)
+        await busy
+
+    async def test_slow_healthy_stream_is_not_cut(self):
+        # Весь поток дольше timeout, но каждый кусок приходит вовремя
+        guard = self.make(timeout=0.05, idle_timeout=0.05)
+        received = [chunk async for chunk in guard.stream(chunks, [0.01] * 10)]
+        self.assertEqual(len(received), 10)
+        self.assertEqual(list(guard.breaker.results), [True])
+
+    async def test_no_first_chunk_is_a_failure(self):
+        guard = self.make(idle_timeout=0.01)
+        with self.assertRaises(LLMUnavailable) as raised:
+            async for _ in guard.stream(chunks, [1]):
+                pass
+        self.assertNotIsInstance(raised.exception, StreamInterrupted)
+        self.assertEqual(guard.breaker.state, "open")
+
+    async def test_break_after_first_chunk(self):
+        guard = self.make(idle_timeout=0.05)
+        received = []
+        with self.assertRaises(StreamInterrupted):
+            async for chunk in guard.stream(chunks, [0, 0, 0], fail_at=2):
+                received.append(chunk)
+        self.assertEqual(received, ["0", "1"])
+        # Учитель ответил — обрыв потока предохранитель не размыкает
+        self.assertEqual(guard.breaker.state, "closed")
+        self.assertEqual(list(guard.breaker.results), [True])
+
+    async def test_stream_releases_slot(self):
+        guard = self.make(concurrency=1, queue_timeout=0.01)
+        async for _ in guard.stream(chunks, [0, 0]):
+            break
+        self.assertEqual([chunk async for chunk in guard.stream(chunks, [0])], ["0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
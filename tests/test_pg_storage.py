@@ -0,0 +1,87 @@
+"""Проверка PostgresStorage на живой базе: TEST_DATABASE_URL=postgresql://... python -m unittest"""
+import os
+import asyncio
+import random
+import unittest
+
+DSN = os.getenv("TEST_DATABASE_URL")
+
+
+@unittest.skipUnless(DSN, "TEST_DATABASE_URL не задан")
+class PostgresStorageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from app.pg_storage import PostgresStorage
+        cls.storage = PostgresStorage(DSN)
+        cls.storage.call("init_db")
+        # Отдельный пользователь на прогон, чтобы не задеть чужие строки
+        cls.user_id = random.randint(10 ** 12, 10 ** 13)
+        cls.lesson_id = -random.randint(1, 10 ** 9)
+
+    @classmethod
+    def tearDownClass(cls):
+        async def cleanup():
+            async with cls.storage.pool.acquire() as conn:
+                for table in ("answers_history", "lessons_progress", "answers_daily", "user_topics"):
+                    await conn.execute(f"DELETE FROM {table} WHERE user_id = $1", cls.user_id)
+                await conn.execute("DELETE FROM users WHERE user_id = $1", cls.user_id)
+                await conn.execute("DELETE FROM item_stats WHERE lesson_id = $1", cls.lesson_id)
+        cls.storage._submit(cleanup())
+        cls.storage.close()
+
+    def test_user_xp_and_answers(self):
+        user, created = self.storage.call("_get_or_create_user", self.user_id, "Test", "test")
+        self.assertTrue(created)
+        self.assertEqual(user["user_id"], self.user_id)
+        _, created = self.storage.call("_get_or_create_user", self.user_id, "Test", "test")
+        self.assertFalse(created)
+
+        self.assertEqual(self.storage.call("_add_xp", self.user_id, 10), 10)
+        self.storage.call("save_answer", self.user_id, "I am", True, lesson_id=1, grader="local")
+        self.storage.call("save_answer", self.user_id, "I is", False, lesson_id=1, grader="local")
+        stats = self.storage.call("get_user_stats", self.user_id)
+        self.assertEqual(stats["total_answers"], 2)
+        self.assertEqual(stats["correct_answers"], 1)
+
+    def test_leaderboard_from_db(self):
+        self.storage.call("_get_or_create_user", self.user_id, "Test", "test")
+        # XP, начисленный «другим процессом» мимо этого хранилища, сразу виден в рейтинге
+        top = self.storage.call("get_top_users")
+        top_xp = top[0]["total_xp"] if top else 0
+        self.storage._submit(self.storage.pool.execute(
+            "UPDATE users SET total_xp = $1 WHERE user_id = $2", top_xp + 1, self.user_id
+        ))
+        rank, total = self.storage.call("get_user_rank", self.user_id)
+        self.assertEqual(rank, 1)
+        self.assertGreaterEqual(total, 1)
+        self.assertEqual(self.storage.call("get_top_users")[0]["user_id"], self.user_id)
+        self.assertEqual(self.storage.call("get_user_rank", -1)[0], None)
+
+    def test_item_stats(self):
+        self.storage.call("record_item_results", self.lesson_id, {0: False, 1: True, 2: False})
+        self.storage.call("record_item_results", self.lesson_id, {0: False, 1: False, 2: False})
+        rows = self.storage.call("get_hardest_items", False, 2, 1000)
+        rates = {row["item"]: row["failure_rate"] for row in rows if row["lesson_id"] == self.lesson_id}
+        self.assertEqual(rates, {1: 0.5, 2: 1.0})
+
+    def test_call_async_does_not_block_loop(self):
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            task = asyncio.create_task(ticker())
+            await asyncio.gather(*(self.storage.call_async("get_user_stats", self.user_id) for _ in range(20)))
+            task.cancel()
+            return ticks
+        # Пока запросы идут в пуле, цикл продолжает выполнять другие задачи
+        self.assertGreater(asyncio.run(run()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Тест на уровень: пробы из уроков и бинарный поиск первого незнакомого урока"""
+import random
+import unittest
+from unittest import mock
+
+from app import placement
+
+WORDS = ["cat", "dog", "house", "tree", "river", "window", "garden", "bridge"]
+
+
+def make_lessons(count):
+    return [
+        {
+            'id': i + 1,
+            'exercise': f"Переведи:\n\n1. слово {i}\n2. ещё слово {i}",
+            'answers': [f"{WORDS[i % len(WORDS)]} {i}", f"big {WORDS[i % len(WORDS)]} {i}"],
+        }
+        for i in range(count)
+    ]
+
+
+class MakeProbeTest(unittest.TestCase):
+
+    def test_item_matches_its_answer(self):
+        lesson = make_lessons(1)[0]
+        probe = placement.make_probe(lesson, random.Random(1))
+        self.assertEqual(probe['instruction'], "Переведи:")
+        index = 0 if probe['item'] == "слово 0" else 1
+        self.assertEqual(probe['expected'], lesson['answers'][index])
+
+    def test_unusable_lessons(self):
+        lesson = make_lessons(1)[0]
+        self.assertIsNone(placement.make_probe({**lesson, 'answers': ["only one"]}))
+        self.assertIsNone(placement.make_probe({**lesson, 'exercise': "Без пунктов"}))
+
+
+class PlacementSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lessons = make_lessons(100)
+        patcher = mock.patch.object(placement, "load_lessons", lambda: self.lessons)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_test(self, knows_up_to, typo=False):
+        """Ученик знает уроки с индексом меньше knows_up_to; возвращает выбранный урок"""
+        state = placement.start_placement()
+        while (probe := placement.next_probe(state)) is not None:
+            known = self.lessons.index(probe['lesson']) < knows_up_to
+            answer = probe['expected'] if known else "I do not know"
+            if known and typo:
+                answer = answer[:-2] + answer[-1]
+            placement.answer_probe(state, answer)
+        return placement.placement_lesson(state)
+
+    def test_finds_first_unknown_lesson(self):
+        for knows_up_to in (0, 1, 37, 64, 99):
+            self.assertEqual(self.run_test(knows_up_to), self.lessons[knows_up_to], knows_up_to)
+
+    def test_knows_everything(self):
+        self.assertEqual(self.run_test(100), self.lessons[-1])
+
+    def test_typo_counts_as_known(self):
+        self.assertEqual(self.run_test(50, typo=True), self.lessons[50])
+
+    def test_probe_limit(self):
+        state = placement.start_placement()
+        with mock.patch.object(placement, "PLACEMENT_PROBES", 2):
+            for _ in range(2):
+                placement.next_probe(state)
+                placement.answer_probe(state, "")
+            self.assertIsNone(placement.next_probe(state))
+        self.assertEqual(state['asked'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
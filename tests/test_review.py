@@ -0,0 +1,35 @@
+"""SM-2: интервалы и лёгкость повторения темы (next_review)"""
+import unittest
+
+from app.database import next_review, MIN_EASE
+
+
+class NextReviewTest(unittest.TestCase):
+
+    def test_first_repetitions(self):
+        self.assertEqual(next_review(2.5, 0, 5), (2.6, 1))
+        self.assertEqual(next_review(2.6, 1, 5), (2.7, 6))
+
+    def test_interval_grows_by_ease(self):
+        ease, interval = next_review(2.5, 6, 4)
+        self.assertEqual(interval, 15)
+        self.assertEqual(ease, 2.5)
+
+    def test_failure_restarts_interval(self):
+        ease, interval = next_review(2.5, 15, 2)
+        self.assertEqual(interval, 1)
+        self.assertEqual(ease, 2.18)
+
+    def test_ease_never_drops_below_minimum(self):
+        ease, interval = 1.4, 10
+        for _ in range(5):
+            ease, interval = next_review(ease, interval, 0)
+        self.assertEqual((ease, interval), (MIN_EASE, 1))
+
+    def test_missing_values_use_defaults(self):
+        # Строки user_topics до миграции: ease и interval_days пустые
+        self.assertEqual(next_review(None, None, 4), (2.5, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
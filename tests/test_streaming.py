@@ -0,0 +1,202 @@
+"""Потоковая генерация уроков против фейкового SSE-сервера (aiohttp.test_utils)"""
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+from app.singleflight import SingleFlight
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from app import streaming
+    from app.streaming import ProgressiveMessage, split_message, answer_long, TELEGRAM_LIMIT
+except ImportError:
+    streaming = None
+
+try:
+    from app import lesson_cache
+except ImportError:
+    lesson_cache = None
+
+
+class FakeSent:
+    def __init__(self, chat, text, parse_mode):
+        self.chat = chat
+        self.text = text
+        self.parse_mode = parse_mode
+        self.edits = 0
+
+    async def edit_text(self, text, parse_mode=None):
+        self.text = text
+        self.parse_mode = parse_mode
+        self.edits += 1
+
+
+class FakeMessage:
+    """Сообщение пользователя: ответы на него копятся в sent"""
+
+    def __init__(self):
+        self.sent = []
+        self.kwargs = []
+
+    async def answer(self, text, parse_mode=None, **kwargs):
+        sent = FakeSent(self, text, parse_mode)
+        self.sent.append(sent)
+        self.kwargs.append(kwargs)
+        return sent
+
+
+def sse_app(chunks, delay=0.0):
+    """Приложение, которое отдаёт chunks как поток chat/completions"""
+    async def completions(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks:
+            payload = {"choices": [{"delta": {"content": chunk}}]}
+            await response.write(f"data: {json.dumps(payload)}\n\n".encode())
+            await asyncio.sleep(delay)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", completions)
+    return app
+
+
+@unittest.skipUnless(streaming, "нужны aiohttp и aiogram")
+class StreamCompletionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reads_sse_chunks(self):
+        server = TestServer(sse_app(["Hello", ", ", "world"]))
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        with mock.patch.object(streaming, "DEEPSEEK_BASE_URL", str(server.make_url("")).rstrip("/")):
+            chunks = [chunk async for chunk in streaming.stream_completion([])]
+        self.assertEqual(chunks, ["Hello", ", ", "world"])
+
+    async def test_stream_lesson_shows_whole_lesson(self):
+        server = TestServer(sse_app(["<b>Урок</b>\n", "Пример"]))
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        message = FakeMessage()
+        with mock.patch.object(streaming, "DEEPSEEK_BASE_URL", str(server.make_url("")).rstrip("/")):
+            lesson = await streaming.stream_lesson(message, "A1", "to be")
+        self.assertEqual(lesson, "<b>Урок</b>\nПример")
+        self.assertEqual(len(message.sent), 1)
+        self.assertEqual(message.sent[0].text, lesson)
+        self.assertEqual(message.sent[0].parse_mode, "HTML")
+
+
+@unittest.skipUnless(streaming, "нужны aiohttp и aiogram")
+class ProgressiveMessageTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_overflow_continues_in_new_message(self):
+        message = FakeMessage()
+        progressive = ProgressiveMessage(message, interval=0)
+        line = "x" * 99 + "\n"
+        for _ in range(60):   # 6000 символов
+            await progressive.feed(line)
+        text = await progressive.finish()
+
+        self.assertEqual(len(message.sent), 2)
+        for sent in message.sent:
+            self.assertLessEqual(len(sent.text), TELEGRAM_LIMIT)
+            self.assertEqual(sent.parse_mode, "HTML")
+        # Режется по переносу строки, ничего не теряется
+        self.assertTrue(message.sent[0].text.endswith("x"))
+        self.assertEqual(text.replace("\n", ""), line.replace("\n", "") * 60)
+
+    async def test_edits_are_throttled(self):
+        message = FakeMessage()
+        progressive = ProgressiveMessage(message, interval=60)
+        for _ in range(50):
+            await progressive.feed("word ")
+        # Первый кусок показан сразу, остальные ждут интервала
+        self.assertEqual(len(message.sent), 1)
+        self.assertEqual(message.sent[0].edits, 0)
+        self.assertIsNone(message.sent[0].parse_mode)
+
+        await progressive.finish()
+        self.assertEqual(message.sent[0].edits, 1)
+        self.assertEqual(message.sent[0].text, "word " * 50)
+        self.assertEqual(message.sent[0].parse_mode, "HTML")
+
+
+@unittest.skipUnless(streaming, "нужны aiohttp и aiogram")
+class SplitMessageTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_short_text_is_one_part(self):
+        self.assertEqual(split_message("Привет"), ["Привет"])
+        self.assertEqual(split_message("  \n"), [])
+
+    def test_splits_on_newline(self):
+        text = "\n".join(["a" * 3000] * 3)
+        parts = split_message(text)
+        self.assertEqual(parts, ["a" * 3000] * 3)
+
+    def test_hard_cut_without_newlines(self):
+        parts = split_message("b" * 9000)
+        self.assertEqual([len(part) for part in parts], [TELEGRAM_LIMIT, TELEGRAM_LIMIT, 9000 - 2 * TELEGRAM_LIMIT])
+
+    async def test_answer_long_puts_markup_on_last_part(self):
+        message = FakeMessage()
+        await answer_long(message, "c" * 5000, reply_markup="markup")
+        self.assertEqual([len(sent.text) for sent in message.sent], [TELEGRAM_LIMIT, 5000 - TELEGRAM_LIMIT])
+        self.assertEqual(message.kwargs, [{}, {"reply_markup": "markup"}])
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight("test", report_every=0)
+        calls = 0
+
+        async def generate():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "lesson"
+
+        results = await asyncio.gather(*(flight.do("key", generate) for _ in range(5)))
+        self.assertEqual(results, ["lesson"] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(flight.stats()["coalesced"], 4)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    async def test_error_reaches_every_waiter(self):
+        flight = SingleFlight("test", report_every=0)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+
+@unittest.skipUnless(lesson_cache, "нужен app.ai_teacher")
+class StreamAndCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_misses_stream_once(self):
+        streams = 0
+
+        async def stream():
+            nonlocal streams
+            streams += 1
+            await asyncio.sleep(0.01)
+            return "lesson"
+
+        with mock.patch.object(lesson_cache, "get_cached_variants", lambda level, topic: []), \
+                mock.patch.object(lesson_cache, "save_cached_lesson", lambda *args: None), \
+                mock.patch.object(lesson_cache, "schedule_refill", lambda level, topic: None):
+            results = await asyncio.gather(*(lesson_cache.stream_and_cache("A1", "to be", stream) for _ in range(3)))
+
+        self.assertEqual(streams, 1)
+        self.assertEqual([lesson for lesson, _ in results], ["lesson"] * 3)
+        # Показан урок только тому, кто его генерировал
+        self.assertEqual(sorted(streamed for _, streamed in results), [False, False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
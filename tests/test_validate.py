@@ -0,0 +1,85 @@
+"""Проверка исходника уроков (app/validate.py) на маленьких файлах"""
+import os
+import tempfile
+import unittest
+
+from app.validate import validate_source, format_issues, _ranges
+
+
+def lesson(lesson_id, level="A1", answers=2, **fields):
+    source = {
+        "id": lesson_id,
+        "level": level,
+        "topic": f"Тема {lesson_id}",
+        "theory": "<b>Теория</b>",
+        "examples": "I am.",
+        "exercise": "Переведи:\n\n1. Я\n2. Ты",
+        "answers": ["I", "You"][:answers],
+    }
+    source.update(fields)
+    return "    " + repr(source) + ",\n"
+
+
+class ValidateSourceTest(unittest.TestCase):
+
+    def validate(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", encoding="utf-8", delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return validate_source(f.name)
+
+    def messages(self, issues, severity="error"):
+        return [issue.message for issue in issues if issue.severity == severity]
+
+    def test_clean_source(self):
+        self.assertEqual(self.validate("lessons = [\n" + lesson(1) + lesson(2, "A2") + "]\n"), [])
+
+    def test_lesson_problems(self):
+        issues = self.validate("lessons = [\n" + lesson(1, answers=1) + lesson(1) + lesson(3, "Z9")
+                               + lesson(4, theory="a < b") + "]\n")
+        errors = self.messages(issues)
+        self.assertIn("ответов 1, а пунктов в задании 2", errors)
+        self.assertTrue(any(message.startswith("повтор id") for message in errors))
+        self.assertIn("неизвестный уровень 'Z9'", errors)
+        self.assertIn("в поле theory символ «<» ломает HTML-разметку", errors)
+        self.assertIn("пропущены id: 2", errors)
+
+    def test_missing_fields(self):
+        issues = self.validate("lessons = [\n    {'id': 1, 'level': 'A1'},\n]\n")
+        self.assertTrue(any(message.startswith("нет полей: topic") for message in self.messages(issues)))
+
+    def test_level_going_back_is_a_warning(self):
+        issues = self.validate("lessons = [\n" + lesson(1, "B1") + lesson(2, "A1") + "]\n")
+        self.assertEqual(self.messages(issues), [])
+        self.assertEqual(self.messages(issues, "warning"), ["уровень A1 после урока 1 уровня B1"])
+
+    def test_broken_structure(self):
+        source = "lessons = [\n" + lesson(1) + "    # Продолжение в следующей части\n" + lesson(2) + "]\n" + lesson(3) + "]\n"
+        issues = self.validate(source)
+        errors = self.messages(issues)
+        self.assertTrue(any(message.startswith("шов между частями") for message in errors))
+        self.assertTrue(any(message.startswith("уроки вне списка lessons") for message in errors))
+        self.assertIn("лишняя закрывающая скобка «]»", errors)
+        # Строки сообщений указывают на место в файле
+        self.assertEqual(next(issue.line for issue in issues if "шов" in issue.message), 3)
+
+    def test_unclosed_string_and_bracket(self):
+        issues = self.validate("lessons = [\n" + lesson(1) + "    {'id': 2, 'topic': 'oops\n")
+        errors = self.messages(issues)
+        self.assertTrue(any(message.startswith("незакрытая строка") for message in errors))
+        self.assertIn("незакрытая скобка «[»", errors)
+
+    def test_format_issues(self):
+        issues = self.validate("lessons = [\n" + lesson(1, "Z9") + "]\n")
+        self.assertEqual(format_issues(issues), "ERROR строка 2: урок 1: неизвестный уровень 'Z9'")
+
+
+class RangesTest(unittest.TestCase):
+
+    def test_ranges(self):
+        self.assertEqual(_ranges([1, 2, 3, 7, 9, 10]), "1-3, 7, 9-10")
+        self.assertEqual(_ranges([]), "")
+
+
+if __name__ == "__main__":
+    unittest.main()